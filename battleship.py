@@ -1,7 +1,7 @@
 import numpy as np
-import pandas as pd
 import random
 import sys
+from collections import OrderedDict
 
 flags = '''
 Flags:
@@ -10,30 +10,31 @@ Flags:
     -c --cheat           print enemy board to speed up game
     -q --quiet           suppress intro message
     -a --automated       automated gameplay
+    --verbosity=LEVEL    output of automated games (silent, summary, final or turn)
+    --record=PATH        append a binary record of the game to PATH
+    --script=PATH        play the moves in PATH (- for stdin) without prompts and
+                         write the results as JSON lines, see script.py
+    --metrics=PATH       write turn timings and counters to PATH when the game ends
+                         (Prometheus text for .prom files, JSON otherwise)
+    --enemy-ai=NAME      shooting strategy of the cpu (random, density or hunt)
+    --user-ai=NAME       shooting strategy of the automated user (random, density or hunt)
+    --size=N             play on an N x N board instead of 10 x 10
+    --fleet=SPEC         ships of both players as label=size with an optional count,
+                         e.g. C=5,b=4,c=3,s=3,d=2 (the default) or C=5,b=4x2,d=2x3
 '''
 intro = '''
 Welcome to my humble battleship game.
 You will have an enemy cpu that you will play against. The cpu
-will chose ship placement and shots fully at random without any
-thought (for now).
+will chose ship placement at random. By default it also shoots
+fully at random without any thought, use --enemy-ai=density for
+a cpu that aims at the cells most likely to hold your ships or
+--enemy-ai=hunt for one that hunts on a checkerboard and then
+targets around its hits.
 You will be prompted to enter the coordinates of your ships if
 you have not activated the -r flag which will generate a board
 for you fully at random. The ships available are:
 
-+------------+-----+------------+
-| Name       | Key | Unit value |
-+------------+-----+------------+
-| Carrier    | C   | 5          |
-+------------+-----+------------+
-| Battleship | b   | 4          |
-+------------+-----+------------+
-| Cruiser    | c   | 3          |
-+------------+-----+------------+
-| Submarine  | s   | 3          |
-+------------+-----+------------+
-| Destroyer  | d   | 2          |
-+------------+-----+------------+
-
+{ships}
 The key values are the in-game values that are used for the
 different ships.
 The coordinates go by row and column value respectively. The
@@ -49,24 +50,714 @@ will exit.
 Good luck...
 '''
 
+# players, also used as the seats of the server and in the records
+USER = 0
+ENEMY = 1
+
+# cell codes used on the uint8 boards
+# 0 is an empty space, 1 a missed hit, 2 a good hit and every ship gets its own code
+# starting at FIRST_SHIP so that any value >= FIRST_SHIP is an untouched ship cell
+EMPTY = 0
+MISS = 1
+HIT = 2
+FIRST_SHIP = 3
+# default names of the ship labels
+SHIP_NAMES = {'C': 'Carrier', 'b': 'Battleship', 'c': 'Cruiser', 's': 'Submarine', 'd': 'Destroyer'}
+
+class Fleet:
+    '''
+    Ships that every player places on their board.
+
+    types is a list of (label, name, size, count) with one entry per type of
+    ship, the label is the single character shown on the board. Every ship
+    gets its own cell code in the order of the types, and all of what is known
+    about a ship is kept in lookup tables indexed by its cell code so that the
+    turns never have to search for it.
+    '''
+    def __init__(self, types):
+        self.types = [(label, name, int(size), int(count)) for label, name, size, count in types]
+        # one entry per ship in the order of the cell codes
+        self.labels = []
+        self.sizes = []
+        for label, name, size, count in self.types:
+            if len(label) != 1 or not label.isprintable() or label in '0MX ':
+                raise ValueError("Ship labels have to be a single character other than 0, M and X, not {!r}".format(
+                    label))
+            if size < 1 or count < 0:
+                raise ValueError("The {} needs a size of at least 1 and a count of at least 0".format(name))
+            self.labels += [label]*count
+            self.sizes += [size]*count
+        if len(set(label for label, name, size, count in self.types)) != len(self.types):
+            raise ValueError("Every type of ship needs its own label")
+        if not self.sizes:
+            raise ValueError("A fleet needs at least one ship")
+        if FIRST_SHIP + len(self.sizes) > 256:
+            raise ValueError("A fleet can have at most {} ships".format(256-FIRST_SHIP))
+        names = {label: name for label, name, size, count in self.types}
+        self.codes = list(range(FIRST_SHIP, FIRST_SHIP+len(self.sizes)))
+        # lookup tables indexed by cell code
+        self.code_sizes = [0]*FIRST_SHIP + self.sizes
+        self.names = ['', '', ''] + [names[label] for label in self.labels]
+        self.chars = np.array(['0', 'M', 'X'] + self.labels)
+        self.bytes = np.frombuffer(''.join(self.chars).encode('ascii'), dtype=np.uint8)
+        # unique name of every ship for statistics, the label followed by the
+        # number of the ship when there are several of the same type
+        counts = {label: count for label, name, size, count in self.types}
+        seen = {}
+        self.ids = ['', '', '']
+        for label in self.labels:
+            seen[label] = seen.get(label, 0) + 1
+            self.ids.append(label if counts[label] == 1 else '{}{}'.format(label, seen[label]))
+        # cell codes of every type of ship
+        self.label_codes = {}
+        for code, label in zip(self.codes, self.labels):
+            self.label_codes.setdefault(label, []).append(code)
+        # sizes fit into a 64 bit key, the same in every process, that tells
+        # fleets apart in the hashes of the strategies
+        self.key = hash(tuple(self.sizes)) & (2**64-1)
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __eq__(self, other):
+        return isinstance(other, Fleet) and self.types == other.types
+
+    def __hash__(self):
+        return hash(tuple(self.types))
+
+    @classmethod
+    def parse(cls, spec):
+        '''
+        Build a fleet from a spec like "C=5,b=4,c=3,s=3,d=2x4", every item is
+        the label and the size of a type of ship with an optional count. The
+        classic labels get their names, any other label is its own name.
+        '''
+        types = []
+        for item in spec.split(','):
+            try:
+                label, size = item.strip().split('=')
+                size, x, count = size.partition('x')
+                # a bare x is a typo rather than a single ship
+                types.append((label, SHIP_NAMES.get(label, label), int(size), int(count) if x else 1))
+            except ValueError:
+                raise ValueError("Did not understand the fleet {!r}, it should look like C=5,b=4,d=2x3".format(
+                    item))
+        return cls(types)
+
+    def table(self):
+        '''
+        The types of ship as a text table for the intro, with a count column
+        only when there is more than one ship of a type.
+        '''
+        columns = [('Name', [name for label, name, size, count in self.types]),
+                   ('Key', [label for label, name, size, count in self.types]),
+                   ('Unit value', [str(size) for label, name, size, count in self.types])]
+        if any(count != 1 for label, name, size, count in self.types):
+            columns.append(('Count', [str(count) for label, name, size, count in self.types]))
+        widths = [max(len(head), *map(len, cells)) for head, cells in columns]
+        rule = '+' + '+'.join('-'*(width+2) for width in widths) + '+\n'
+        rows = [[head for head, cells in columns]] + [list(row) for row in zip(*[cells for head, cells in columns])]
+        return rule + ''.join('| ' + ' | '.join(cell.ljust(width) for cell, width in zip(row, widths)) + ' |\n' + rule
+                              for row in rows)
+
+    def check(self, n):
+        '''
+        Raise ValueError if the fleet can never fit on an n x n board.
+        '''
+        if max(self.sizes) > n:
+            raise ValueError("A ship of size {} does not fit on a {} x {} board".format(max(self.sizes), n, n))
+        if sum(self.sizes) > n*n:
+            raise ValueError("The fleet covers {} cells but the board only has {}".format(sum(self.sizes), n*n))
+
+# times the random placement tries to fit the whole fleet before it gives up
+PLACEMENT_ATTEMPTS = 100
+
+# the fleet of the original game
+DEFAULT_FLEET = Fleet([('C', 'Carrier', 5, 1), ('b', 'Battleship', 4, 1), ('c', 'Cruiser', 3, 1),
+                       ('s', 'Submarine', 3, 1), ('d', 'Destroyer', 2, 1)])
+# tables of the default fleet
+# ship size indexed by cell code so that the hit counters do not need a dictionary lookup
+CODE_SIZES = DEFAULT_FLEET.code_sizes
+# lookup table to go from a cell code to the ascii byte shown on the terminal
+CELL_BYTES = DEFAULT_FLEET.bytes
+
+def _new_user_pieces(fleet):
+    '''
+    Create the table that controls what has already been placed, sizes, and
+    names of the users ships, one row per ship indexed by its cell code.
+    pandas is only imported here as it is slow to import and only the manual
+    placement of the ships needs it.
+    '''
+    import pandas as pd
+    user_pieces = pd.DataFrame({'exists': np.zeros(len(fleet), dtype=bool),
+                                'size': fleet.sizes,
+                                'full_name': ['{} ({})'.format(fleet.names[code], fleet.labels[i])
+                                              for i, code in enumerate(fleet.codes)]},
+                               index=fleet.codes)
+    return user_pieces
+
+# verbosity levels
+# SILENT prints nothing, SUMMARY only the result of the game, FINAL adds the
+# boards at the end of the game and EVERY_TURN prints every shot and the boards
+# after every turn
+SILENT = 0
+SUMMARY = 1
+FINAL = 2
+EVERY_TURN = 3
+VERBOSITY = {'silent': SILENT, 'summary': SUMMARY, 'final': FINAL, 'turn': EVERY_TURN}
+
+def render_board(board, cell_bytes=CELL_BYTES):
+    '''
+    Render a board of any size into a single string ready to be written to the
+    terminal. The cells of all of the rows are filled into one byte array with
+    the cell codes translated through cell_bytes, the bytes of a Fleet, so only
+    the row and column labels are formatted one by one.
+    '''
+    n = board.shape[0]
+    # every column is as wide as the largest index
+    w = len(str(n-1))
+    dash = '-'*(w+2)
+    border = '+' + '+'.join([dash]*(n+1)) + '+\n'
+    sep = '|' + '+'.join([dash]*(n+1)) + '|\n'
+    header = '| ' + ' '*w + ' |' + ''.join(' {:>{w}} |'.format(col, w=w) for col in range(n)) + '\n'
+    # width of a line including the newline
+    width = len(sep)
+    rows = np.full((n, width), ord(' '), dtype=np.uint8)
+    # vertical bars at the start and at the end of every field
+    rows[:, 0] = ord('|')
+    rows[:, w+3::w+3] = ord('|')
+    rows[:, -1] = ord('\n')
+    # right aligned row labels
+    labels = ''.join('{:>{w}}'.format(row, w=w) for row in range(n)).encode('ascii')
+    rows[:, 2:2+w] = np.frombuffer(labels, dtype=np.uint8).reshape(n, w)
+    # the character of every cell sits right before the closing bar of its field
+    rows[:, 2*w+4::w+3] = cell_bytes[board]
+    # put a separator line between the rows
+    lines = np.empty((2*n-1, width), dtype=np.uint8)
+    lines[0::2] = rows
+    lines[1::2] = np.frombuffer(sep.encode('ascii'), dtype=np.uint8)
+    return border + header + sep + lines.tobytes().decode('ascii') + border
+
+class CellPool:
+    '''
+    Pool of the cells of a board that have not been shot at yet.
+    The cells are stored by their flat index in a list along with the position
+    of every cell in that list. Drawing or removing a cell swaps it with the
+    last one in the list and pops it, so both take constant time and every
+    draw is uniform over the remaining cells.
+    By default the pool holds all of the cells of a board with size cells,
+    a subset of them can be given instead.
+    '''
+    def __init__(self, size, cells=None):
+        if cells is None:
+            self.cells = list(range(size))
+            self.pos = list(range(size))
+        else:
+            self.cells = list(cells)
+            # -1 marks the cells that are not in the pool
+            self.pos = [-1]*size
+            for i, cell in enumerate(self.cells):
+                self.pos[cell] = i
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, cell):
+        return self.pos[cell] >= 0
+
+    def remove(self, cell):
+        # move the last cell into the place of the removed one
+        # returns the position the cell had for restore
+        i = self.pos[cell]
+        last = self.cells[-1]
+        self.cells[i] = last
+        self.pos[last] = i
+        self.cells.pop()
+        self.pos[cell] = -1
+        return i
+
+    def discard(self, cell):
+        # -1 when the cell was not in the pool
+        if self.pos[cell] >= 0:
+            return self.remove(cell)
+        return -1
+
+    def restore(self, cell, i):
+        # undo the remove that took the cell from position i, the cell that was
+        # moved into its place goes back to the end so the order is the same
+        if i < len(self.cells):
+            moved = self.cells[i]
+            self.pos[moved] = len(self.cells)
+            self.cells.append(moved)
+            self.cells[i] = cell
+        else:
+            self.cells.append(cell)
+        self.pos[cell] = i
+
+    def copy(self):
+        pool = CellPool.__new__(CellPool)
+        pool.cells = self.cells[:]
+        pool.pos = self.pos[:]
+        return pool
+
+    def draw(self, rng):
+        cell = self.cells[rng.randrange(len(self.cells))]
+        self.remove(cell)
+        return cell
+
+def _row_window_sums(values, size):
+    # sliding window sum along the rows through the cumulative sum padded with
+    # a leading zero
+    dtype = np.float64 if values.dtype.kind == 'f' else np.int32
+    csum = np.zeros(values.shape[:-1] + (values.shape[-1]+1,), dtype=dtype)
+    np.cumsum(values, axis=-1, out=csum[..., 1:])
+    return csum[..., size:] - csum[..., :-size]
+
+def window_sums(values, size):
+    '''
+    Sum the values of a board over every window that a ship of the given size
+    can take. Works on a single (n, n) board or any stack of them. Returns the
+    sums of the horizontal windows with shape (..., n, n-size+1) and of the
+    vertical windows with shape (..., n-size+1, n), indexed by the anchor of
+    the ship.
+    '''
+    horizontal = _row_window_sums(values, size)
+    vertical = np.swapaxes(_row_window_sums(np.swapaxes(values, -1, -2), size), -1, -2)
+    return horizontal, vertical
+
+def free_placements(occupied, size):
+    '''
+    Find all of the anchors where a ship of the given size fits without
+    overlapping the occupied cells.
+    Returns the horizontal and vertical masks with the shapes of window_sums,
+    True where a ship anchored at those coordinates fits.
+    '''
+    horizontal, vertical = window_sums(occupied, size)
+    return horizontal == 0, vertical == 0
+
+def coverage(horizontal, vertical, size):
+    '''
+    Inverse of window_sums. Takes the weights of the horizontal and vertical
+    placements indexed by their anchor and adds up, for every cell, the weights
+    of the placements that cover it.
+    '''
+    # a cell is covered by the placements anchored up to size-1 cells before it
+    # which is a window sum over the anchors padded with size-1 zeros
+    pad = [(0, 0)]*(horizontal.ndim-1) + [(size-1, size-1)]
+    total = _row_window_sums(np.pad(horizontal, pad), size)
+    vertical = np.swapaxes(vertical, -1, -2)
+    total = total + np.swapaxes(_row_window_sums(np.pad(vertical, pad), size), -1, -2)
+    return total
+
+class PlacementIndex:
+    '''
+    Index of the legal placements of ships on a board.
+    For every ship size it holds the masks from free_placements. Sampling picks
+    one of the legal placements uniformly with a single draw and placing a ship
+    only clears the anchors of the placements that overlap it.
+    '''
+    def __init__(self, board, sizes):
+        self.n = board.shape[0]
+        occupied = board >= FIRST_SHIP
+        self.masks = {size: free_placements(occupied, size) for size in set(sizes)}
+
+    def sample(self, size, rng):
+        '''
+        Uniformly pick one of the legal placements for a ship of the given size.
+        Returns the anchor coordinates and the direction, 0 for horizontally and
+        1 for vertically.
+        '''
+        horizontal, vertical = self.masks[size]
+        h = np.flatnonzero(horizontal)
+        # both directions give the same placements for ships of size one
+        v = np.flatnonzero(vertical) if size > 1 else h[:0]
+        if not len(h) and not len(v):
+            raise ValueError("There is no room left on the board for a ship of size {}".format(size))
+        k = rng.randrange(len(h) + len(v))
+        if k < len(h):
+            coord_1, coord_2 = divmod(int(h[k]), self.n-size+1)
+            return coord_1, coord_2, 0
+        coord_1, coord_2 = divmod(int(v[k-len(h)]), self.n)
+        return coord_1, coord_2, 1
+
+    def place(self, coord_1, coord_2, direc, size):
+        '''
+        Remove all of the placements that overlap the newly placed ship.
+        '''
+        # last row and column covered by the ship
+        end_1 = coord_1 + (size-1 if direc else 0)
+        end_2 = coord_2 + (0 if direc else size-1)
+        for other, (horizontal, vertical) in self.masks.items():
+            # horizontal ships on the rows of the ship anchored up to other-1
+            # cells to the left of it
+            horizontal[coord_1:end_1+1, max(0, coord_2-other+1):end_2+1] = False
+            # vertical ships on the columns of the ship anchored up to other-1
+            # cells above it
+            vertical[max(0, coord_1-other+1):end_1+1, coord_2:end_2+1] = False
+
+class RandomShooter:
+    '''
+    Shooting strategy that fires at the untried cells fully at random without
+    any thought.
+
+    Every strategy is built from the size of the board and the Fleet of the
+    game and has the same three methods. choose gets the guess board of
+    the shooter, the pool of untried cells and the random generator of the game
+    and returns the flat index of an untried cell. record is called with the
+    result of the shot, the cell code of the ship that was hit or MISS, whether
+    the ship was sunk and whether the game keeps a history to undo the shot.
+    unrecord takes back the last undoable shot that was recorded for
+    Battleship.undo. copy returns an independent copy for forks of the game.
+    '''
+    def __init__(self, n, fleet=None):
+        self.n = n
+
+    def choose(self, guess, untried, rng):
+        return untried.cells[rng.randrange(len(untried))]
+
+    def record(self, cell, code, sunk, undoable=False):
+        pass
+
+    def unrecord(self, cell, code, sunk):
+        pass
+
+    def copy(self):
+        # nothing to copy
+        return self
+
+# random keys of the zobrist hashes of the guess boards indexed by board size
+# and number of cell codes
+_ZOBRIST = {}
+
+def zobrist_keys(n, codes=len(CODE_SIZES)):
+    '''
+    Random 64 bit keys for the zobrist hash of the guess board of an n x n
+    board and the ships that have been sunk, for the cell codes below codes.
+    keys[cell, code] is xored into the hash when the cell gets the result
+    code, MISS or the cell code of the ship that was hit. The extra last row
+    holds the key the hash starts from in column 0 and the keys of the sunk
+    ships in the columns of their codes. The keys only depend on n and codes
+    so they are the same in every process.
+    '''
+    if (n, codes) not in _ZOBRIST:
+        rng = np.random.default_rng([n, codes])
+        _ZOBRIST[n, codes] = rng.integers(0, 2**64, size=(n*n+1, codes), dtype=np.uint64)
+    return _ZOBRIST[n, codes]
+
+class ShotCache:
+    '''
+    Bounded LRU cache of the shot decisions of a strategy keyed by the hash of
+    the position. Once maxsize positions are stored the least recently used
+    one is dropped.
+    '''
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hit_rate}
+
+class DensityShooter:
+    '''
+    Shooting strategy that fires at the cell most likely to hold a ship.
+
+    The hits are told which ship they struck, so for every ship that is still
+    afloat the placements consistent with what is known are the ones that miss
+    all the misses and the hits of other ships, and cover all of the hits on
+    that ship. Every consistent placement of a ship is equally likely, so the
+    coverage of those placements divided by their number is the probability of
+    the ship being on each cell. All of the counting is done with window_sums
+    and coverage over the whole board at once.
+
+    The best cells of every position are kept in cache, keyed by a zobrist
+    hash of the guess board and the sunk ships that record updates with one
+    xor per shot, so positions that come up again, i.e. the opening of every
+    game, only cost a lookup.
+    '''
+    # decisions shared by all of the density shooters, set it to None to
+    # compute every density
+    cache = ShotCache()
+
+    def __init__(self, n, fleet=None):
+        self.n = n
+        self.fleet = fleet or DEFAULT_FLEET
+        # known hits of every ship indexed by cell code
+        self.ship_hits = {code: np.zeros((n, n), dtype=bool) for code in self.fleet.codes}
+        self.hit_count = dict.fromkeys(self.fleet.codes, 0)
+        self.afloat = set(self.fleet.codes)
+        self.keys = zobrist_keys(n, len(self.fleet.code_sizes))
+        # the key of the fleet keeps positions of different fleets apart
+        self.hash = int(self.keys[n*n, 0]) ^ self.fleet.key
+
+    def _ship_density(self, misses, hits, code, size):
+        '''
+        Probability of every cell holding the ship with the given cell code and
+        size. The code is None for any ship of that size that has not been hit.
+        '''
+        if code is None:
+            blocked = misses | hits
+        else:
+            own = self.ship_hits[code]
+            # cells that this ship can not be on
+            blocked = misses | (hits & ~own)
+        horizontal, vertical = free_placements(blocked, size)
+        if code is not None:
+            # it has to cover all of its own hits
+            own_h, own_v = window_sums(own, size)
+            horizontal &= own_h == self.hit_count[code]
+            vertical &= own_v == self.hit_count[code]
+        if size == 1:
+            vertical = np.zeros_like(vertical)
+        count = np.count_nonzero(horizontal) + np.count_nonzero(vertical)
+        if not count:
+            return 0.0
+        return coverage(horizontal, vertical, size) / count
+
+    def density(self, guess):
+        '''
+        Probability of every cell holding one of the ships that are still afloat.
+        '''
+        misses = guess == MISS
+        hits = guess == HIT
+        density = np.zeros((self.n, self.n))
+        # ships of the same size that have not been hit yet all have the same
+        # density so it is only worked out once for each size
+        unhit = {}
+        for code in self.afloat:
+            size = self.fleet.code_sizes[code]
+            if self.hit_count[code]:
+                density += self._ship_density(misses, hits, code, size)
+            else:
+                unhit[size] = unhit.get(size, 0) + 1
+        for size, ships in unhit.items():
+            ship = self._ship_density(misses, hits, None, size)
+            for _ in range(ships):
+                density += ship
+        # no point in shooting the same cell twice
+        density[guess != EMPTY] = 0
+        return density
+
+    def best_cells(self, guess):
+        '''
+        Flat indices of the cells with the highest density, none when no ship
+        can be anywhere.
+        '''
+        density = self.density(guess)
+        best = density.max()
+        if best <= 0:
+            return density.ravel()[:0].astype(np.intp)
+        return np.flatnonzero(density == best)
+
+    def choose(self, guess, untried, rng):
+        cache = self.cache
+        cells = None
+        if cache is not None:
+            cells = cache.get(self.hash)
+            # guard against a collision of the hashes
+            if cells is not None and len(cells) and cells[0] not in untried:
+                cells = None
+        if cells is None:
+            cells = self.best_cells(guess)
+            if cache is not None:
+                cache.put(self.hash, cells)
+        if not len(cells):
+            return untried.cells[rng.randrange(len(untried))]
+        # break ties at random
+        return int(cells[rng.randrange(len(cells))])
+
+    def record(self, cell, code, sunk, undoable=False):
+        self.hash ^= int(self.keys[cell, code])
+        if code < FIRST_SHIP:
+            return
+        self.ship_hits[code].flat[cell] = True
+        self.hit_count[code] += 1
+        if sunk:
+            self.afloat.discard(code)
+            self.hash ^= int(self.keys[self.n*self.n, code])
+
+    def unrecord(self, cell, code, sunk):
+        # every step of record is its own inverse or a counter
+        self.hash ^= int(self.keys[cell, code])
+        if code < FIRST_SHIP:
+            return
+        self.ship_hits[code].flat[cell] = False
+        self.hit_count[code] -= 1
+        if sunk:
+            self.afloat.add(code)
+            self.hash ^= int(self.keys[self.n*self.n, code])
+
+    def copy(self):
+        shooter = DensityShooter.__new__(DensityShooter)
+        shooter.n = self.n
+        shooter.fleet = self.fleet
+        shooter.ship_hits = {code: hits.copy() for code, hits in self.ship_hits.items()}
+        shooter.hit_count = dict(self.hit_count)
+        shooter.afloat = set(self.afloat)
+        shooter.keys = self.keys
+        shooter.hash = self.hash
+        return shooter
+
+class HuntTargetShooter:
+    '''
+    Shooting strategy that hunts on a checkerboard and targets around its hits.
+
+    While hunting it fires at the random cells of every k-th diagonal, where k
+    is the size of the smallest ship, as no ship can hide between them. For
+    the default fleet that is one colour of the checkerboard. Every
+    hit queues the untried neighbours of the cell for the ship that was hit and
+    the queues are worked through before hunting again. Once a ship has two hits
+    its direction is known and only the neighbours along that line are kept.
+    The queue of a ship is dropped when it is sunk. Nothing is read back from
+    the board so every turn costs constant time. What record changes for the
+    undoable shots is kept in a log so that unrecord can put it back.
+    '''
+    def __init__(self, n, fleet=None):
+        self.n = n
+        k = min((fleet or DEFAULT_FLEET).sizes)
+        self.hunt = CellPool(n*n, [cell for cell in range(n*n) if sum(divmod(cell, n)) % k == 0])
+        # cells to try next and the hits of every ship that is still afloat
+        # indexed by cell code
+        self.targets = {}
+        self.hits = {}
+        # for every undoable shot the position the cell had in the hunt pool
+        # and, for hits, the queues and hits from before the shot
+        self.log = []
+
+    def choose(self, guess, untried, rng):
+        # the queues are only read so that a shot can be taken back, the cells
+        # that have been tried since they were queued are skipped
+        for code, queue in self.targets.items():
+            for cell in reversed(queue):
+                if cell in untried:
+                    return cell
+        if len(self.hunt):
+            return self.hunt.cells[rng.randrange(len(self.hunt))]
+        # the checkerboard is done but a ship is left, only possible when its
+        # neighbours were all tried before so fall back to random shots
+        return untried.cells[rng.randrange(len(untried))]
+
+    def _neighbours(self, cell, line):
+        r, c = divmod(cell, self.n)
+        out = []
+        if line != 'v':
+            if c > 0:
+                out.append(cell-1)
+            if c < self.n-1:
+                out.append(cell+1)
+        if line != 'h':
+            if r > 0:
+                out.append(cell-self.n)
+            if r < self.n-1:
+                out.append(cell+self.n)
+        return out
+
+    def record(self, cell, code, sunk, undoable=False):
+        pos = self.hunt.discard(cell)
+        if code < FIRST_SHIP:
+            if undoable:
+                self.log.append((pos, None, None))
+            return
+        if undoable:
+            # the queues are few and short, only a handful of cells per ship
+            self.log.append((pos, {c: queue[:] for c, queue in self.targets.items()},
+                             {c: hits[:] for c, hits in self.hits.items()}))
+        if sunk:
+            self.targets.pop(code, None)
+            self.hits.pop(code, None)
+            return
+        hits = self.hits.setdefault(code, [])
+        queue = self.targets.setdefault(code, [])
+        line = None
+        if hits:
+            # the first hit gives the direction of the ship
+            line = 'h' if hits[0] // self.n == cell // self.n else 'v'
+            if len(hits) == 1:
+                # keep only the queued cells on that line
+                first = hits[0]
+                if line == 'h':
+                    queue[:] = [i for i in queue if i // self.n == first // self.n]
+                else:
+                    queue[:] = [i for i in queue if i % self.n == first % self.n]
+        hits.append(cell)
+        queue.extend(self._neighbours(cell, line))
+
+    def unrecord(self, cell, code, sunk):
+        pos, targets, hits = self.log.pop()
+        if pos >= 0:
+            self.hunt.restore(cell, pos)
+        if targets is not None:
+            # copies as the entries of the log are shared with forks
+            self.targets = {c: queue[:] for c, queue in targets.items()}
+            self.hits = {c: ship_hits[:] for c, ship_hits in hits.items()}
+
+    def copy(self):
+        shooter = HuntTargetShooter.__new__(HuntTargetShooter)
+        shooter.n = self.n
+        shooter.hunt = self.hunt.copy()
+        shooter.targets = {code: queue[:] for code, queue in self.targets.items()}
+        shooter.hits = {code: hits[:] for code, hits in self.hits.items()}
+        # the entries are never changed so they can be shared
+        shooter.log = self.log[:]
+        return shooter
+
+# shooting strategies by the name used on the command line
+STRATEGIES = {'random': RandomShooter, 'density': DensityShooter, 'hunt': HuntTargetShooter}
+
 class Battleship:
-    # this is a customized method for pretty printing pandas dataframes on the terminal
+    # this is a customized method for pretty printing the boards on the terminal
     # just needed it to be a bit more organized
-    def print_board(self, df):
-        print("+---+---+---+---+---+---+---+---+---+---+---+")
-        print("|   | 0 | 1 | 2 | 3 | 4 | 5 | 6 | 7 | 8 | 9 |")
-        print("|---+---+---+---+---+---+---+---+---+---+---|")
-        for row in df.index:
-            text = '| {} |'.format(row)
-            for col in df.columns:
-                text += ' {} |'.format(df.loc[row,col])
-            print(text)
-            # check if we are at the last line
-            if row != self.n:
-                print("|---+---+---+---+---+---+---+---+---+---+---|")
-        print("+---+---+---+---+---+---+---+---+---+---+---+")
-
-    def _check_for_existing_ship(self, coord, direc, size, df):
+    def print_board(self, board):
+        # the whole frame is rendered into one string and written at once
+        sys.stdout.write(render_board(board, self.fleet.bytes))
+
+    def render_boards(self, cheat=False):
+        '''
+        Render the boards shown to the user after a turn into one string.
+        The enemy board is only added in cheat mode.
+        '''
+        cell_bytes = self.fleet.bytes
+        frame = ["----User guess board (X are hits, M are misses)\n", render_board(self.user_guess, cell_bytes),
+                 "----User game board (X are hits, M are misses)\n", render_board(self.user_board, cell_bytes)]
+        if cheat:
+            frame += ["---Enemy game board\n", render_board(self.enem_board, cell_bytes)]
+        return ''.join(frame)
+
+    def _check_for_existing_ship(self, coord, direc, size, board):
         '''
         Method to check if the ship to be placed will intersect with any
         other ship already on the board. If so it goes back to coordinate
@@ -77,95 +768,171 @@ class Battleship:
         # 1 for vertically
         if direc == 0:
             # grab the slice of the data to later check its values
-            slice = df.loc[coord[0], range(coord[1], coord[1]+size)]
+            slice = board[coord[0], coord[1]:coord[1]+size]
         else:
-            slice = df.loc[range(coord[0], coord[0]+size), coord[1]]
-        # determine if any of the values in the slice are a string
-        # this is safe to do as we are at the initialization step and only have integers or the existing
-        # ships on the board
-        vals = [isinstance(i, str) for i in slice]
-        # return if we found any true values
-        return any(vals)
-
-    def _place_enemy_ship(self, size, label):
-        conflict = True
-        while conflict:
-            # set first coord
-            coord_1 = random.randint(0,self.n-size)
-            # set second coord
-            coord_2 = random.randint(0,self.n-size)
-            # set direction
-            direc = random.randint(0, 1)
-            # check if there is a ship there already
-            conflict = self._check_for_existing_ship([coord_1, coord_2], direc, size, self.enem_board)
-            # if there is no ship in the way record the ship position
-            if not conflict:
-                if direc == 0:
-                    self.enem_board.loc[coord_1, range(coord_2, coord_2+size)] = label
-                else:
-                    self.enem_board.loc[range(coord_1, coord_1+size), coord_2] = label
+            slice = board[coord[0]:coord[0]+size, coord[1]]
+        # determine if any of the values in the slice are a ship code
+        # this is safe to do as we are at the initialization step and only have empty spaces or the
+        # existing ships on the board
+        return bool((slice >= FIRST_SHIP).any())
+
+    def _placements(self, player):
+        '''
+        Placement index of the board of the given player.
+        It is built the first time a ship is placed at random.
+        '''
+        if player == USER:
+            if self.user_placements is None:
+                self.user_placements = PlacementIndex(self.user_board, self.fleet.sizes)
+            return self.user_placements
+        if self.enem_placements is None:
+            self.enem_placements = PlacementIndex(self.enem_board, self.fleet.sizes)
+        return self.enem_placements
+
+    def _put_ship(self, player, code, coord_1, coord_2, direc, size):
+        '''
+        Write a ship that is known to fit onto the board of the given player and
+        update everything that keeps track of the ships.
+        '''
+        if self._shared:
+            self._unshare()
+        if player == USER:
+            board, placements, placed = self.user_board, self.user_placements, self.user_placed
+            self.user_hp += size
+        else:
+            board, placements, placed = self.enem_board, self.enem_placements, self.enem_placed
+            self.enem_hp += size
+        if direc == 0:
+            board[coord_1, coord_2:coord_2+size] = code
+        else:
+            board[coord_1:coord_1+size, coord_2] = code
+        if placements is not None:
+            placements.place(coord_1, coord_2, direc, size)
+        placed.add(code)
+        if self.recorder is not None:
+            self.recorder.place(player, code, coord_1, coord_2, direc, size)
+
+    def _place_random_ship(self, player, code):
+        '''
+        Method to place the ship with the given cell code on one of the legal
+        placements chosen uniformly at random from the placement index of the board.
+        '''
+        if self._rng_shared:
+            self._unshare_rng()
+        size = self.fleet.code_sizes[code]
+        coord_1, coord_2, direc = self._placements(player).sample(size, self.rng)
+        self._put_ship(player, code, coord_1, coord_2, direc, size)
+        return coord_1, coord_2, direc
+
+    def _place_enemy_ship(self, code):
+        return self._place_random_ship(ENEMY, code)
+
+    def place_random_ships(self, player):
+        '''
+        Place the ships of the given player that are not on the board yet at
+        random, the largest first as they are the hardest to fit. Returns the
+        (code, row, col, direc) of every ship that was placed.
+        '''
+        placed = self.user_placed if player == USER else self.enem_placed
+        place = self._place_enemy_ship if player == ENEMY else self._place_random_user_ship
+        sizes = self.fleet.code_sizes
+        codes = [code for code in sorted(self.fleet.codes, key=lambda code: -sizes[code]) if code not in placed]
+        # a crowded board can run out of room for the last ships, they are all
+        # taken off again and placed from scratch, so the recorder only gets
+        # the placements that worked
+        recorder, self.recorder = self.recorder, None
+        try:
+            for attempt in range(PLACEMENT_ATTEMPTS):
+                placements = []
+                try:
+                    for code in codes:
+                        placements.append((code,) + place(code))
+                    break
+                except ValueError:
+                    self._remove_ships(player, [placement[0] for placement in placements])
+                    if self.metrics is not None:
+                        self.metrics.count('fleet_retries')
+            else:
+                raise ValueError("Could not place the fleet at random after {} attempts".format(PLACEMENT_ATTEMPTS))
+        finally:
+            self.recorder = recorder
+        if recorder is not None:
+            for code, coord_1, coord_2, direc in placements:
+                recorder.place(player, code, coord_1, coord_2, direc, sizes[code])
+        return placements
+
+    def _remove_ships(self, player, codes):
+        '''
+        Take the ships with the given cell codes off the board of the given
+        player before any shot was fired.
+        '''
+        if player == USER:
+            board, placed = self.user_board, self.user_placed
+            self.user_hp -= sum(self.fleet.code_sizes[code] for code in codes)
+            self.user_placements = None
+        else:
+            board, placed = self.enem_board, self.enem_placed
+            self.enem_hp -= sum(self.fleet.code_sizes[code] for code in codes)
+            self.enem_placements = None
+        board[np.isin(board, codes)] = EMPTY
+        placed.difference_update(codes)
+
+    def place_ship(self, player, label, coord_1, coord_2, direc):
+        '''
+        Place a ship of the given player, USER or ENEMY, without any printing.
+        The direction is 0 for horizontally and 1 for vertically.
+        Raises ValueError with the reason when the ship can not go there.
+        '''
+        if label not in self.fleet.label_codes:
+            raise ValueError("Sorry, I did not understand your ship selection {}".format(label))
+        placed = self.user_placed if player == USER else self.enem_placed
+        # the first ship of the type that is not on the board yet
+        code = next((code for code in self.fleet.label_codes[label] if code not in placed), None)
+        if code is None:
+            raise ValueError("You have already set the coordinates for that ship")
+        if direc not in (0, 1):
+            raise ValueError("The direction has to be Horizontal (0), or Vertical (1)")
+        size = self.fleet.code_sizes[code]
+        # check if the ship will fit given the chosen coordinates
+        if direc == 0:
+            end_1, end_2 = coord_1, coord_2+size-1
+        else:
+            end_1, end_2 = coord_1+size-1, coord_2
+        if coord_1 < 0 or coord_2 < 0 or end_1 > self.n or end_2 > self.n:
+            raise ValueError("Sorry, the starting coordinate you have chosen will not allow\nfor the ship to fit on the board.")
+        # check for a ship in the way
+        board = self.user_board if player == USER else self.enem_board
+        if self._check_for_existing_ship([coord_1, coord_2], direc, size, board):
+            raise ValueError("Sorry, there is a ship in the way.")
+        self._put_ship(player, code, coord_1, coord_2, direc, size)
+        return code
+
+    def fleet_placed(self, player):
+        '''
+        Check if the given player has placed all of their ships.
+        '''
+        placed = self.user_placed if player == USER else self.enem_placed
+        return len(placed) == len(self.fleet)
 
     def place_enemy_pieces(self):
         '''
         Method to randomly place the enemy ships on the board
         '''
-        print("Placing enemy pieces")
-        # place enemy carrier
-        self._place_enemy_ship(5, 'C')
-        # place enemy Battleship
-        self._place_enemy_ship(4, 'b')
-        # place enemy Cruiser
-        self._place_enemy_ship(3, 'c')
-        # place enemy Submarine
-        self._place_enemy_ship(3, 's')
-        # place enemy Destroyer
-        self._place_enemy_ship(2, 'd')
+        if self.verbose >= EVERY_TURN:
+            print("Placing enemy pieces")
+        self.place_random_ships(ENEMY)
 
     def place_user_piece(self, c1, c2, label):
         # try block to account for a possible user key misspress and have a safe
         # way for the program to go back without aborting
         try:
-            if self.user_pieces.loc[label,'exists']:
-                print("==================================================================")
-                print("You have already set the coordinates for that ship")
-                print("==================================================================")
-                return False
-        except KeyError:
-            print("==================================================================")
-            print("Sorry, I did not understand your ship selection {}".format(label))
-            print("==================================================================")
-            return False
-        # set the direction of placement
-        if c2 == 0:
-            # check if the ship will fit given the chosen coordinates
-            if c1[1] + self.user_pieces.loc[label, 'size'] >= self.n:
-                print("==================================================================")
-                print("Sorry, the starting coordinate you have chosen will not allow\nfor the ship to fit on the board.")
-                print("==================================================================")
-                return False
-        else:
-            # check if the ship will fit given the chosen coordinates
-            if c1[0] + self.user_pieces.loc[label, 'size'] >= self.n:
-                print("==================================================================")
-                print("Sorry, the starting coordinate you have chosen will not allow\nfor the ship to fit on the board.")
-                print("==================================================================")
-                return False
-        # get the size of the ship
-        size = self.user_pieces.loc[label, 'size']
-        # check for a ship in the way
-        conflict = self._check_for_existing_ship(c1, c2, size, self.user_board)
-        if conflict:
+            code = self.place_ship(USER, label, c1[0], c1[1], c2)
+        except ValueError as e:
             print("==================================================================")
-            print("Sorry, there is a ship in the way.")
+            print(e)
             print("==================================================================")
             return False
-        else:
-            # save position of new ship on the board
-            if c2 == 0:
-                self.user_board.loc[c1[0], range(c1[1], c1[1]+size)] = label
-            else:
-                self.user_board.loc[range(c1[0], c1[0]+size), c1[1]] = label
-        self.user_pieces.loc[label, 'exists'] = True
+        self.user_pieces.loc[code, 'exists'] = True
         # print the board that has been made so far for the user
         print("User board so far")
         self.print_board(self.user_board)
@@ -180,32 +947,231 @@ class Battleship:
         print("==================================================================")
         print("Please play again\nExiting.....")
         print("==================================================================")
+        # keep what has been recorded of the game so far
+        if self.recorder is not None:
+            self.recorder.writer.flush()
         sys.exit()
 
+    def _record_hit(self, code, user_ship):
+        '''
+        Method to update the hit counters after the ship with the given cell code
+        has been hit. Returns True if the hit sunk the ship.
+        '''
+        if user_ship:
+            self.user_hp -= 1
+            hits = self.user_ship_hits
+            sunk_at = self.user_sunk_at
+            shots = self.enem_shots
+        else:
+            self.enem_hp -= 1
+            hits = self.enem_ship_hits
+            sunk_at = self.enem_sunk_at
+            shots = self.user_shots
+        hits[code] += 1
+        if hits[code] == self.fleet.code_sizes[code]:
+            # remember how many shots it took to sink the ship
+            sunk_at[code] = shots
+            return True
+        return False
+
+    def record_result(self):
+        '''
+        Record the winner of a finished game if the game is being recorded.
+        '''
+        if self.recorder is not None:
+            self.recorder.end(USER if self.enem_hp == 0 else ENEMY, self.user_shots)
+
     def _is_game_over(self):
         '''
         Method to check if one of the players ships have all been sunk.
         '''
-        user_lost = False
-        enem_lost = False
-        # check to see if the user lost
-        for ship in self.pieces.index.values:
-            tmp = ship in self.user_board.values
-            if tmp:
-                user_lost = False
-                break
-            else:
-                user_lost = True
-        # check if the enemy lost
-        for ship in self.pieces.index.values:
-            tmp = ship in self.enem_board.values
-            if tmp:
-                enem_lost = False
-                break
-            else:
-                enem_lost = True
+        # a player lost when they have no hit points left
+        # the counters are kept up to date by the turn methods so there is no need
+        # to look at the boards
+        user_lost = self.user_hp == 0
+        enem_lost = self.enem_hp == 0
         return user_lost, enem_lost
 
+    def fire(self, player, coord_1, coord_2):
+        '''
+        Resolve a shot of the given player, USER or ENEMY, at the board of the
+        other player without any printing or prompts.
+        Returns the cell code of the ship that was hit or MISS and whether the
+        shot sunk the ship. Raises ValueError if the cell is not on the board or
+        has already been struck.
+        '''
+        if not (0 <= coord_1 <= self.n and 0 <= coord_2 <= self.n):
+            raise ValueError("The coordinates {},{} are not on the board.".format(coord_1, coord_2))
+        if self._shared:
+            self._unshare()
+        if player == USER:
+            board, guess, untried, ai = self.enem_board, self.user_guess, self.user_untried, self.user_ai
+        else:
+            board, guess, untried, ai = self.user_board, self.enem_guess, self.enem_untried, self.enemy_ai
+        if guess[coord_1,coord_2] != EMPTY:
+            raise ValueError("We have already struck those coordinates.")
+        cell = coord_1*(self.n+1) + coord_2
+        # keep the pool of untried cells in sync with the guess board
+        pos = untried.remove(cell)
+        if player == USER:
+            self.user_shots += 1
+            shots = self.user_shots
+        else:
+            self.enem_shots += 1
+            shots = self.enem_shots
+        # determine if its a hit or miss
+        code = int(board[coord_1,coord_2])
+        sunk = False
+        if code >= FIRST_SHIP:
+            sunk = self._record_hit(code, player == ENEMY)
+            board[coord_1,coord_2] = HIT
+            guess[coord_1,coord_2] = HIT
+        else:
+            code = MISS
+            board[coord_1,coord_2] = MISS
+            guess[coord_1,coord_2] = MISS
+        # tell the strategy what happened, it only has to remember how to take
+        # the shot back when there is a history to undo it from
+        ai.record(cell, code, sunk, self.history is not None)
+        if self.recorder is not None:
+            self.recorder.shot(player, shots, coord_1, coord_2, code, sunk)
+        if self.history is not None:
+            self.history.append((player, cell, code, sunk, pos))
+        return code, sunk
+
+    def undo(self):
+        '''
+        Take back the last shot fired by either player and return it as the
+        tuple (player, cell, code, sunk).
+        Only works while history is a list, it is None by default so that
+        nothing is kept. The game, including the order of the pool of untried
+        cells, and the strategy of the player are put back exactly as they
+        were before the shot. Only the random generator and the recorder are
+        not rewound, use snapshot and restore for the generator.
+        '''
+        if not self.history:
+            raise ValueError("There is no shot to undo")
+        if self._shared:
+            self._unshare()
+        player, cell, code, sunk, pos = self.history.pop()
+        coord_1, coord_2 = divmod(cell, self.n+1)
+        if player == USER:
+            board, guess, untried, ai = self.enem_board, self.user_guess, self.user_untried, self.user_ai
+            self.user_shots -= 1
+        else:
+            board, guess, untried, ai = self.user_board, self.enem_guess, self.enem_untried, self.enemy_ai
+            self.enem_shots -= 1
+        if code >= FIRST_SHIP:
+            if player == USER:
+                self.enem_hp += 1
+                hits, sunk_at = self.enem_ship_hits, self.enem_sunk_at
+            else:
+                self.user_hp += 1
+                hits, sunk_at = self.user_ship_hits, self.user_sunk_at
+            hits[code] -= 1
+            if sunk:
+                sunk_at[code] = 0
+            board[coord_1,coord_2] = code
+        else:
+            board[coord_1,coord_2] = EMPTY
+        guess[coord_1,coord_2] = EMPTY
+        untried.restore(cell, pos)
+        ai.unrecord(cell, code, sunk)
+        return player, cell, code, sunk
+
+    def _share_state(self, game):
+        '''
+        Make game a copy-on-write copy of the state of this game.
+        The counters are copied and everything that grows with the board is
+        shared until either game changes it.
+        '''
+        game.user_board = self.user_board
+        game.user_guess = self.user_guess
+        game.enem_board = self.enem_board
+        game.enem_guess = self.enem_guess
+        game.user_untried = self.user_untried
+        game.enem_untried = self.enem_untried
+        game.enemy_ai = self.enemy_ai
+        game.user_ai = self.user_ai
+        # the placement indices are rebuilt from the boards if they are needed
+        game.user_placements = None
+        game.enem_placements = None
+        self._shared = game._shared = True
+        game.user_placed = set(self.user_placed)
+        game.enem_placed = set(self.enem_placed)
+        game.user_hp = self.user_hp
+        game.enem_hp = self.enem_hp
+        game.user_ship_hits = self.user_ship_hits[:]
+        game.enem_ship_hits = self.enem_ship_hits[:]
+        game.user_shots = self.user_shots
+        game.enem_shots = self.enem_shots
+        game.user_sunk_at = self.user_sunk_at[:]
+        game.enem_sunk_at = self.enem_sunk_at[:]
+        game.history = None if self.history is None else self.history[:]
+
+    def _unshare(self):
+        # take private copies of everything _share_state shares
+        self.user_board = self.user_board.copy()
+        self.user_guess = self.user_guess.copy()
+        self.enem_board = self.enem_board.copy()
+        self.enem_guess = self.enem_guess.copy()
+        self.user_untried = self.user_untried.copy()
+        self.enem_untried = self.enem_untried.copy()
+        self.enemy_ai = self.enemy_ai.copy()
+        self.user_ai = self.user_ai.copy()
+        self._shared = False
+
+    def _unshare_rng(self):
+        # copying the state of a generator takes tens of microseconds so it is
+        # only done when a game that shares its generator draws from it
+        rng = random.Random()
+        rng.setstate(self.rng.getstate())
+        self.rng = rng
+        self._rng_shared = False
+
+    def fork(self, rng=None):
+        '''
+        Independent copy of the game to play "what if" branches on.
+        Forking takes microseconds, the boards, pools of untried cells and
+        strategies are only copied by the first of the two games that changes
+        them. rng is the random generator of the fork,
+        by default it continues from the state of the generator of this game
+        which is then copied on the next draw of either game. The fork is
+        silent and does not record the game or collect metrics.
+        '''
+        game = Battleship.__new__(Battleship)
+        game.verbose = SILENT
+        game.n = self.n
+        game.auto = True
+        game.recorder = None
+        game.metrics = None
+        game._user_pieces = None
+        game.fleet = self.fleet
+        self._share_state(game)
+        if rng is None:
+            game.rng = self.rng
+            self._rng_shared = game._rng_shared = True
+        else:
+            game.rng = rng
+            game._rng_shared = False
+        return game
+
+    def snapshot(self):
+        '''
+        Snapshot of the state of the game that restore can go back to any
+        number of times. It is a fork that is not meant to be played.
+        '''
+        return self.fork()
+
+    def restore(self, snapshot):
+        '''
+        Put the game back into the state of a snapshot, including the random
+        generator. Costs as much as a fork.
+        '''
+        snapshot._share_state(self)
+        self.rng = snapshot.rng
+        self._rng_shared = snapshot._rng_shared = True
+
     def user_turn(self):
         '''
         Game mechanic for the users turn.
@@ -223,326 +1189,434 @@ class Battleship:
                 print("==================================================================")
                 print("Must give two coordinates to anchor ship")
                 print("==================================================================")
-                success = False
                 continue
             # convert strings to list of integers
             coords = [int(i.strip()) for i in d]
             # create new variables to store them
             c1, c2 = coords
-            # check for an existing miss or hit
-            if self.user_guess.loc[c1,c2] != 'X' and self.user_guess.loc[c1,c2] != 'M':
-                # we already know that this guess is a new one
-                # need to determine if its a hit or miss
-                conflict = False
-                if isinstance(self.enem_board.loc[c1,c2], str):
-                    # give output as to what got hit
-                    print("Hurrah!!\nWe have hit the enemy {}".format(self.pieces[self.enem_board.loc[c1,c2]]))
-                    a = input("Press enter to continue....")
-                    if a == 'exit':
-                        self._stop_game()
-                    self.enem_board.loc[c1,c2] = 'X'
-                    self.user_guess.loc[c1,c2] = 'X'
-                else:
-                    print("We have missed the enemy!")
-                    a = input("Press enter to continue....")
-                    if a == 'exit':
-                        self._stop_game()
-                    self.enem_board.loc[c1,c2] = 'M'
-                    self.user_guess.loc[c1,c2] = 'M'
-            else:
-                conflict = True
+            # fire fails on an existing miss or hit
+            try:
+                code, sunk = self.fire(USER, c1, c2)
+            except ValueError as e:
                 print("==================================================================")
-                print("We have already struck those coordinates.")
+                print(e)
                 print("==================================================================")
+                continue
+            conflict = False
+            if code >= FIRST_SHIP:
+                # give output as to what got hit
+                print("Hurrah!!\nWe have hit the enemy {}".format(self.fleet.names[code]))
+                if sunk:
+                    print("We have sunk the enemy {}".format(self.fleet.names[code]))
+            else:
+                print("We have missed the enemy!")
+            a = input("Press enter to continue....")
+            if a == 'exit':
+                self._stop_game()
         return
 
     def auto_user_turn(self):
         '''
         Automated user turn.
         '''
-        conflict = True
-        while conflict:
-            # get the coordinates as a random integer
-            c1 = random.randint(0,self.n)
-            c2 = random.randint(0,self.n)
-            # check for existing guess
-            if self.user_guess.loc[c1,c2] != 'X' and self.user_guess.loc[c1,c2] != 'M':
-                conflict = False
-                # determine if its a hit or miss
-                if isinstance(self.enem_board.loc[c1,c2], str):
-                    print("Hurrah!!\nWe have hit the enemy {}".format(self.pieces[self.enem_board.loc[c1,c2]]))
-                    self.enem_board.loc[c1,c2] = 'X'
-                    self.user_guess.loc[c1,c2] = 'X'
-                else:
-                    print("We have missed the enemy!")
-                    self.enem_board.loc[c1,c2] = 'M'
-                    self.user_guess.loc[c1,c2] = 'M'
+        if self._shared:
+            self._unshare()
+        if self._rng_shared:
+            self._unshare_rng()
+        # let the strategy pick a cell that has not been shot at yet
+        cell = self.user_ai.choose(self.user_guess, self.user_untried, self.rng)
+        code, sunk = self.fire(USER, *divmod(cell, self.n+1))
+        if self.verbose >= EVERY_TURN:
+            if code >= FIRST_SHIP:
+                print("Hurrah!!\nWe have hit the enemy {}".format(self.fleet.names[code]))
+                if sunk:
+                    print("We have sunk the enemy {}".format(self.fleet.names[code]))
             else:
-                conflict = True
+                print("We have missed the enemy!")
         return
 
     def enemy_turn(self):
         '''
         Automated enemy turn.
         '''
-        conflict = True
-        while conflict:
-            # get the coordinates as a random integer
-            c1 = random.randint(0,self.n)
-            c2 = random.randint(0,self.n)
-            # check for existing guess
-            if self.enem_guess.loc[c1,c2] != 'X' and self.enem_guess.loc[c1,c2] != 'M':
-                conflict = False
-                # determine if its a hit or miss
-                if isinstance(self.user_board.loc[c1,c2], str):
-                    # give some output as to what got hit
-                    print("Oh no!!\nOur {} has been hit".format(self.pieces[self.user_board.loc[c1,c2]]))
-                    if not self.auto:
-                        a = input("Press enter to continue....")
-                        if a == 'exit':
-                            self._stop_game()
-                    self.user_board.loc[c1,c2] = 'X'
-                    self.enem_guess.loc[c1,c2] = 'X'
-                else:
-                    print("The enemy has missed our ships!")
-                    if not self.auto:
-                        a = input("Press enter to continue....")
-                        if a == 'exit':
-                            self._stop_game()
-                    self.user_board.loc[c1,c2] = 'M'
-                    self.enem_guess.loc[c1,c2] = 'M'
+        if self._shared:
+            self._unshare()
+        if self._rng_shared:
+            self._unshare_rng()
+        # let the strategy pick a cell that has not been shot at yet
+        cell = self.enemy_ai.choose(self.enem_guess, self.enem_untried, self.rng)
+        code, sunk = self.fire(ENEMY, *divmod(cell, self.n+1))
+        # give some output as to what got hit
+        if self.verbose >= EVERY_TURN:
+            if code >= FIRST_SHIP:
+                print("Oh no!!\nOur {} has been hit".format(self.fleet.names[code]))
+                if sunk:
+                    print("Our {} has been sunk".format(self.fleet.names[code]))
             else:
-                conflict = True
+                print("The enemy has missed our ships!")
+        if not self.auto:
+            a = input("Press enter to continue....")
+            if a == 'exit':
+                self._stop_game()
         return
 
-    def _place_random_user_ship(self, size, label):
+    def _place_random_user_ship(self, code):
         '''
         Method to place the users ships at random thorugh the -r flag.
         '''
-        conflict = True
-        while conflict:
-            # set first coord
-            coord_1 = random.randint(0,self.n-size)
-            # set second coord
-            coord_2 = random.randint(0,self.n-size)
-            # set direction
-            direc = random.randint(0, 1)
-            # check if there is a ship there already
-            conflict = self._check_for_existing_ship([coord_1, coord_2], direc, size, self.user_board)
-            if not conflict:
-                if direc == 0:
-                    self.user_board.loc[coord_1, range(coord_2, coord_2+size)] = label
-                else:
-                    self.user_board.loc[range(coord_1, coord_1+size), coord_2] = label
+        return self._place_random_ship(USER, code)
 
     def random_user_board(self):
         '''
         Place the users ships.
         '''
-        print("Placing user pieces at random")
-        # place enemy carrier
-        self._place_random_user_ship(5, 'C')
-        # place random_user Battleship
-        self._place_random_user_ship(4, 'b')
-        # place random_user Cruiser
-        self._place_random_user_ship(3, 'c')
-        # place random_user Submarine
-        self._place_random_user_ship(3, 's')
-        # place random_user Destroyer
-        #print("Placing Destroyer")
-        self._place_random_user_ship(2, 'd')
-        print("---Generated user board---")
-        self.print_board(self.user_board)
+        if self.verbose >= EVERY_TURN:
+            print("Placing user pieces at random")
+        self.place_random_ships(USER)
+        if self.verbose >= EVERY_TURN:
+            print("---Generated user board---")
+            self.print_board(self.user_board)
+
+    @property
+    def user_pieces(self):
+        if self._user_pieces is None:
+            self._user_pieces = _new_user_pieces(self.fleet)
+        return self._user_pieces
 
-    def __init__(self, n=10):
+    def __init__(self, n=10, verbose=True, seed=None, enemy_ai='random', user_ai='random', fleet=None):
         '''
         Initialization of program through creation of boards and other variables
+
+        verbose is one of the verbosity levels, True is the same as EVERY_TURN and
+        False as SILENT which turns off all of the printing in the automated
+        methods so that games can be simulated without any I/O. The seed is used
+        for the random number generator of this game only. enemy_ai and user_ai
+        are the names of the shooting strategies in STRATEGIES of the cpu and of
+        the automated user turns. fleet is the Fleet both players place, the
+        classic five ships by default.
+        Raises ValueError if the fleet does not fit on the board.
         '''
-        print("Generating {} x {} board".format(n,n))
+        self.fleet = fleet or DEFAULT_FLEET
+        self.fleet.check(n)
+        if verbose is True:
+            verbose = EVERY_TURN
+        self.verbose = int(verbose)
+        if self.verbose >= EVERY_TURN:
+            print("Generating {} x {} board".format(n,n))
         self.n = n-1
+        # every game has its own generator so that games can be reproduced
+        self.rng = random.Random(seed)
+        # the automated mode does not wait for the user to press enter
+        self.auto = False
+        # all of the boards are n x n uint8 arrays holding the cell codes
         # initialize user board
-        self.user_board = pd.DataFrame(np.zeros((n,n),dtype=int))
+        self.user_board = np.zeros((n,n), dtype=np.uint8)
         # initialize the users guess board
         # just created it so that the user can know where they have guessed without
         # looking at the enemy board
-        self.user_guess = pd.DataFrame(np.zeros((n,n),dtype=int))
+        self.user_guess = np.zeros((n,n), dtype=np.uint8)
         # initialize enemy board
-        self.enem_board = pd.DataFrame(np.zeros((n,n),dtype=int))
+        self.enem_board = np.zeros((n,n), dtype=np.uint8)
         # initialize enemy guess board
-        self.enem_guess = pd.DataFrame(np.zeros((n,n),dtype=int))
+        self.enem_guess = np.zeros((n,n), dtype=np.uint8)
+        # cells that each player has not shot at yet
+        self.user_untried = CellPool(n*n)
+        self.enem_untried = CellPool(n*n)
+        # shooting strategies of the cpu and the automated user
+        for name in (enemy_ai, user_ai):
+            if name not in STRATEGIES:
+                raise ValueError("Unknown strategy {}, choose one of {}".format(name, ', '.join(STRATEGIES)))
+        self.enemy_ai = STRATEGIES[enemy_ai](n, self.fleet)
+        self.user_ai = STRATEGIES[user_ai](n, self.fleet)
+        # GameRecorder from the records module that gets every placement and shot
+        # nothing is recorded when it is None
+        self.recorder = None
+        # metrics.Metrics that the retry counters go to, set by Metrics.instrument
+        # which also times the turns, nothing is measured when it is None
+        self.metrics = None
+        # index of the legal ship placements for the random placement
+        # only built when it is needed
+        self.user_placements = None
+        self.enem_placements = None
+        # shots fired as (player, cell, code, sunk, pos) for undo, pos is the
+        # position the cell had in the pool of untried cells
+        # nothing is kept when it is None
+        self.history = None
+        # set by fork when the arrays and pools or the random generator are
+        # shared with another game, they get copied before they are changed
+        self._shared = False
+        self._rng_shared = False
+        # cell codes of the ships each player has placed
+        self.user_placed = set()
+        self.enem_placed = set()
+        # remaining hit points of each player
+        # they grow as ships are placed and shrink with every good hit
+        self.user_hp = 0
+        self.enem_hp = 0
+        # number of hits that every ship has taken indexed by its cell code
+        self.user_ship_hits = [0]*len(self.fleet.code_sizes)
+        self.enem_ship_hits = [0]*len(self.fleet.code_sizes)
+        # number of shots fired by each player
+        self.user_shots = 0
+        self.enem_shots = 0
+        # shot number at which every ship was sunk indexed by its cell code
+        # 0 means the ship is still afloat
+        self.user_sunk_at = [0]*len(self.fleet.code_sizes)
+        self.enem_sunk_at = [0]*len(self.fleet.code_sizes)
         # this controls what has already been placed, sizes, and names of the ships
-        self.user_pieces = pd.DataFrame(np.transpose([[False, False, False, False, False], [5,4,3,3,2],
-                                         ['Carrier (C)', 'Battleship (b)', 'Cruiser(c)', 'Submarine (s)',
-                                                                                            'Destroyer (d)']]),
-                                        index=['C','b','c','s','d'], columns=['exists', 'size', 'full_name'])
-        # explicitly define types
-        self.user_pieces['exists'] = np.array([False, False, False, False, False]).astype(bool)
-        self.user_pieces['size'] = self.user_pieces['size'].astype(int)
-        # create legend for the pieces labels
-        self.pieces = pd.Series(['Carrier', 'Battleship', 'Cruiser', 'Submarine', 'Destroyer'],
-                                index=['C','b','c','s','d'])
-
-# a whole bunch of flag parsing stuff
-# for randomly chosen user ship placement
-rand = False
-# to be allowed to view the enemy board to make things go faster
-cheat = False
-# do not print introductory message
-quiet = False
-# print help page
-help = False
-# carry out game in an automated fashion
-# the user will not have any input as to the shots taken
-auto = False
-if len(sys.argv) > 1:
-    for i in sys.argv:
-        if i[0] == '-' and not i[1] == '-':
-            for j in i[1:]:
-                if j == 'r':
+        # built on first use by the user_pieces property
+        self._user_pieces = None
+
+def main(argv=None):
+    '''
+    Command line entry point that plays a game in the terminal.
+    '''
+    if argv is None:
+        argv = sys.argv[1:]
+    # a whole bunch of flag parsing stuff
+    # for randomly chosen user ship placement
+    rand = False
+    # to be allowed to view the enemy board to make things go faster
+    cheat = False
+    # do not print introductory message
+    quiet = False
+    # print help page
+    help = False
+    # carry out game in an automated fashion
+    # the user will not have any input as to the shots taken
+    auto = False
+    # shooting strategy of the cpu
+    enemy_ai = 'random'
+    # shooting strategy of the automated user
+    user_ai = 'random'
+    # how much gets printed, only used for automated games
+    verbosity = EVERY_TURN
+    # file to record the game to
+    record = None
+    # file to write the metrics of the game to
+    metrics = None
+    # board size and ships of the game
+    n = 10
+    fleet = DEFAULT_FLEET
+    if len(argv) > 0:
+        for i in argv:
+            if i[0] == '-' and not i[1] == '-':
+                for j in i[1:]:
+                    if j == 'r':
+                        rand = True
+                    elif j == 'q':
+                        quiet = True
+                    elif j == 'h':
+                        help = True
+                    elif j == 'c':
+                        cheat = True
+                    elif j == 'a':
+                        auto = True
+                        rand = True
+                    else:
+                        print("Did not understand given flag {}".format(j))
+                        print("Available flags")
+                        print(flags)
+                        sys.exit()
+            elif i[0] == '-' and i[1] == '-':
+                if i[2:] == 'random-user':
                     rand = True
-                elif j == 'q':
+                elif i[2:] == 'cheat':
+                    cheat = True
+                elif i[2:] == 'quiet':
                     quiet = True
-                elif j == 'h':
+                elif i[2:] == 'help':
                     help = True
-                elif j == 'c':
-                    cheat = True
-                elif j == 'a':
+                elif i[2:] == 'automated':
                     auto = True
                     rand = True
+                elif i[2:].startswith('enemy-ai=') or i[2:].startswith('user-ai='):
+                    name = i.split('=', 1)[1]
+                    if name not in STRATEGIES:
+                        print("Did not understand given strategy {}".format(name))
+                        print("Available strategies: {}".format(', '.join(STRATEGIES)))
+                        sys.exit()
+                    if i[2:].startswith('enemy-ai='):
+                        enemy_ai = name
+                    else:
+                        user_ai = name
+                elif i[2:].startswith('verbosity='):
+                    level = i.split('=', 1)[1]
+                    if level not in VERBOSITY:
+                        print("Did not understand given verbosity {}".format(level))
+                        print("Available levels: {}".format(', '.join(VERBOSITY)))
+                        sys.exit()
+                    verbosity = VERBOSITY[level]
+                elif i[2:].startswith('record='):
+                    record = i.split('=', 1)[1]
+                elif i[2:].startswith('metrics='):
+                    metrics = i.split('=', 1)[1]
+                elif i[2:].startswith('size='):
+                    size = i.split('=', 1)[1]
+                    if not size.isdigit() or int(size) < 1:
+                        print("Did not understand given board size {}".format(size))
+                        sys.exit()
+                    n = int(size)
+                elif i[2:].startswith('fleet='):
+                    try:
+                        fleet = Fleet.parse(i.split('=', 1)[1])
+                    except ValueError as e:
+                        print(e)
+                        sys.exit()
+                elif i[2:].startswith('script='):
+                    # scripted games have nothing to do with the terminal game
+                    from script import run_script
+                    sys.exit(run_script(i.split('=', 1)[1]))
                 else:
-                    print("Did not understand given flag {}".format(j))
+                    print("Did not understand given flag {}".format(i))
                     print("Available flags")
                     print(flags)
                     sys.exit()
-        elif i[0] == '-' and i[1] == '-':
-            if i[2:] == 'random-user':
-                rand = True
-            elif i[2:] == 'cheat':
-                cheat = True
-            elif i[2:] == 'quiet':
-                quiet = True
-            elif i[2:] == 'help':
-                help = True
-            elif i[2:] == 'automated':
-                auto = True
-                rand = True
-            else:
-                print("Did not understand given flag {}".format(j))
-                print("Available flags")
-                print(flags)
-                sys.exit()
-# print help page (flags really)
-if help:
-    print(flags)
-    sys.exit()
-
-if not quiet:
-    print(intro)
-
-# create class instance
-battle = Battleship()
-#battle.generate_board()
-# place the enemy pieces
-battle.place_enemy_pieces()
-# set class attribute if auto was selected
-if auto:
-    battle.auto = True
-else:
-    battle.auto = False
-# go thorugh ship placement if -r flag not given
-if not rand:
-    placed_all = False
-    while not placed_all:
-        # give input as to what remains to be placed
-        print("Remaining pieces to place:")
-        for ship in battle.user_pieces.values:
-            if ship[0]:
-                continue
-            else:
-                print(ship[2])
-        print("Now we will begin by placing your pieces")
-        success = False
-        while not success:
-            # get which ship to add
-            ship = input("Which ship would you like to add? (C, b, c, s, or d) ")
-            if ship == 'exit':
-                battle._stop_game()
-            # get the coordinates to place them on the board
-            c1 = input("Input the coordinates to anchor ship on. ")
-            if c1 == 'exit':
-                battle._stop_game()
-            # check the string formatiing and parse the string
-            d = c1.split(',')
-            if len(d) != 2:
-                print("==================================================================")
-                print("Must give two coordinates to anchor ship")
-                print("==================================================================")
-                success = False
-                continue
-            # create array of int
-            c1 = [int(i.strip()) for i in d]
-            # get the direction to place the ship
-            c2 = input("Input direction which the ship will assume.\nHorizontal (0), or Vertical (1). ")
-            if c2 == 'exit':
-                battle._stop_game()
-            # transform to int
-            c2 = int(c2)
-            # try to place the piece
-            success = battle.place_user_piece(c1, c2, ship)
-        # check that all the pieces have been placed on the board
-        temp = True
-        for exist in battle.user_pieces['exists'].values:
-            temp *= exist
-        placed_all = temp
-else:
-    # executes when -r flag is given
-    battle.random_user_board()
-# Start of game
-print("==================================================================")
-print("We will now begin the game!\nGood luck....")
-print("==================================================================")
-game_over = False
-turns = 0
-# loop until we get the game_over condition when one player has all of their ships sunk
-while not game_over:
-    # start with the users turn
-    print("==================================================================")
-    print("Users turn")
-    print("==================================================================")
+    # print help page (flags really)
+    if help:
+        print(flags)
+        sys.exit()
+
+    # the user has to see everything to play
     if not auto:
-        battle.user_turn()
+        verbosity = EVERY_TURN
+
+    if not quiet and verbosity >= EVERY_TURN:
+        print(intro.format(ships=fleet.table()))
+
+    # create class instance
+    try:
+        battle = Battleship(n, verbose=verbosity, enemy_ai=enemy_ai, user_ai=user_ai, fleet=fleet)
+    except ValueError as e:
+        print(e)
+        sys.exit()
+    if record is not None:
+        from records import RecordWriter
+        writer = RecordWriter(record)
+        battle.recorder = writer.new_game(battle.n+1)
+    if metrics is not None:
+        from metrics import Metrics
+        Metrics().instrument(battle)
+    #battle.generate_board()
+    # place the enemy pieces
+    # a fleet that only just fits the board may not be placed at random
+    try:
+        battle.place_enemy_pieces()
+    except ValueError as e:
+        print(e)
+        sys.exit()
+    # set class attribute if auto was selected
+    if auto:
+        battle.auto = True
+    else:
+        battle.auto = False
+    # go thorugh ship placement if -r flag not given
+    if not rand:
+        placed_all = False
+        while not placed_all:
+            # give input as to what remains to be placed
+            print("Remaining pieces to place:")
+            for ship in battle.user_pieces.values:
+                if ship[0]:
+                    continue
+                else:
+                    print(ship[2])
+            print("Now we will begin by placing your pieces")
+            success = False
+            while not success:
+                # get which ship to add
+                labels = [label for label, name, size, count in fleet.types if count]
+                ship = input("Which ship would you like to add? ({}, or {}) ".format(', '.join(labels[:-1]), labels[-1])
+                             if len(labels) > 1 else "Which ship would you like to add? ({}) ".format(labels[0]))
+                if ship == 'exit':
+                    battle._stop_game()
+                # get the coordinates to place them on the board
+                c1 = input("Input the coordinates to anchor ship on. ")
+                if c1 == 'exit':
+                    battle._stop_game()
+                # check the string formatiing and parse the string
+                d = c1.split(',')
+                if len(d) != 2:
+                    print("==================================================================")
+                    print("Must give two coordinates to anchor ship")
+                    print("==================================================================")
+                    success = False
+                    continue
+                # create array of int
+                c1 = [int(i.strip()) for i in d]
+                # get the direction to place the ship
+                c2 = input("Input direction which the ship will assume.\nHorizontal (0), or Vertical (1). ")
+                if c2 == 'exit':
+                    battle._stop_game()
+                # transform to int
+                c2 = int(c2)
+                # try to place the piece
+                success = battle.place_user_piece(c1, c2, ship)
+            # check that all the pieces have been placed on the board
+            temp = True
+            for exist in battle.user_pieces['exists'].values:
+                temp *= exist
+            placed_all = temp
     else:
-        battle.auto_user_turn()
-    # check win condition
-    user_lost, enem_lost = battle._is_game_over()
-    if user_lost or enem_lost:
-        game_over = True
-        continue 
-    # enemy turn
-    print("==================================================================")
-    print("Enemy turn")
-    print("==================================================================")
-    battle.enemy_turn()
-    # check win condition
-    user_lost, enem_lost = battle._is_game_over()
-    if user_lost or enem_lost:
-        game_over = True
-        continue
-    # print out the board containing the users guesses
-    print("----User guess board (X are hits, M are misses)")
-    battle.print_board(battle.user_guess)
-    # print out the users board
-    print("----User game board (X are hits, M are misses)")
-    battle.print_board(battle.user_board)
-    # only gets shown when -c flag is present
-    if cheat:
-        # Cheat mode allows you to see the enemies ships
-        print("---Enemy game board")
-        battle.print_board(battle.enem_board)
-    # increment turn counter
-    turns += 1
-# game over
-print("==================================================================")
-print(" Game over.\n {} won after {} turns.\n Please Play Again....".format("User" if enem_lost else "Enemy", turns))
-print("==================================================================")
+        # executes when -r flag is given
+        try:
+            battle.random_user_board()
+        except ValueError as e:
+            print(e)
+            sys.exit()
+    # Start of game
+    if verbosity >= EVERY_TURN:
+        print("==================================================================")
+        print("We will now begin the game!\nGood luck....")
+        print("==================================================================")
+    game_over = False
+    turns = 0
+    # loop until we get the game_over condition when one player has all of their ships sunk
+    while not game_over:
+        # start with the users turn
+        if verbosity >= EVERY_TURN:
+            print("==================================================================")
+            print("Users turn")
+            print("==================================================================")
+        if not auto:
+            battle.user_turn()
+        else:
+            battle.auto_user_turn()
+        # check win condition
+        user_lost, enem_lost = battle._is_game_over()
+        if user_lost or enem_lost:
+            game_over = True
+            continue 
+        # enemy turn
+        if verbosity >= EVERY_TURN:
+            print("==================================================================")
+            print("Enemy turn")
+            print("==================================================================")
+        battle.enemy_turn()
+        # check win condition
+        user_lost, enem_lost = battle._is_game_over()
+        if user_lost or enem_lost:
+            game_over = True
+            continue
+        # print out the board containing the users guesses and the users board
+        # the enemy board only gets shown when -c flag is present
+        if verbosity >= EVERY_TURN:
+            sys.stdout.write(battle.render_boards(cheat))
+        # increment turn counter
+        turns += 1
+    # game over
+    if record is not None:
+        battle.record_result()
+        writer.close()
+    if metrics is not None:
+        battle.metrics.dump(metrics)
+    if verbosity >= FINAL:
+        # show where everything was at the end
+        sys.stdout.write(battle.render_boards(cheat=True))
+    if verbosity >= SUMMARY:
+        print("==================================================================")
+        print(" Game over.\n {} won after {} turns.\n Please Play Again....".format("User" if enem_lost else "Enemy", turns))
+        print("==================================================================")
 
+if __name__ == '__main__':
+    main()
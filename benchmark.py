@@ -0,0 +1,170 @@
+'''
+Benchmarks of the different stages of a game across board sizes.
+
+Every stage is timed on its own with a game set up outside of the timed
+region. Stages that leave the game usable, like the turns, are run many times
+on the same game so that big boards do not spend the run building games.
+The results are written as JSON so that runs can be compared.
+
+Usage:
+    python benchmark.py                          # print the results
+    python benchmark.py -o before.json           # save them
+    python benchmark.py -o after.json --compare before.json
+'''
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+import numpy as np
+from battleship import Battleship
+from simulation import play_game
+
+# board sizes used when none are given
+SIZES = [10, 30, 100, 300, 1000]
+
+def _setup(n, enemy_ai, placed=False):
+    battle = Battleship(n, verbose=False, seed=n, enemy_ai=enemy_ai)
+    battle.auto = True
+    if placed:
+        battle.place_enemy_pieces()
+        battle.random_user_board()
+    return battle
+
+def _print_board(battle):
+    # time the formatting without paying for the terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        battle.print_board(battle.user_board)
+
+# stage name, whether the game needs its ships placed, how many times the
+# stage can run on one game of size n (None for no limit) and the timed call
+# the full game sets up its own game so it is handled in run_benchmarks
+STAGES = [
+    ('place_enemy_pieces', False, lambda n: 1, lambda battle: battle.place_enemy_pieces()),
+    ('random_user_board', False, lambda n: 1, lambda battle: battle.random_user_board()),
+    # the enemy can shoot every cell once
+    ('enemy_turn', True, lambda n: n*n, lambda battle: battle.enemy_turn()),
+    ('_is_game_over', True, lambda n: None, lambda battle: battle._is_game_over()),
+    ('print_board', True, lambda n: None, _print_board),
+    ('full_game', False, lambda n: 1, None),
+]
+
+def time_stage(setup, run, min_time=0.2, max_repeat=1000, calls=1, max_time=None):
+    '''
+    Time run(obj) until min_time seconds have been spent in run or it ran
+    max_repeat times. Every obj from setup() is run up to calls times, None
+    for as often as needed, before the next one is set up. The timing also
+    stops after max_time seconds of wall time including the setups, ten times
+    min_time by default, once there is at least one timing.
+    Returns the list of timings in seconds.
+    '''
+    if max_time is None:
+        max_time = 10*min_time
+    deadline = time.perf_counter() + max_time
+    times = []
+    total = 0.0
+    while total < min_time and len(times) < max_repeat:
+        if times and time.perf_counter() > deadline:
+            break
+        obj = setup()
+        runs = 0
+        while total < min_time and len(times) < max_repeat and (calls is None or runs < calls):
+            start = time.perf_counter()
+            run(obj)
+            elapsed = time.perf_counter() - start
+            times.append(elapsed)
+            total += elapsed
+            runs += 1
+    return times
+
+def run_benchmarks(sizes=SIZES, stages=None, enemy_ai='random', min_time=0.2, max_repeat=1000, log=None):
+    '''
+    Run the benchmarks and return a list with one record per stage and board
+    size.
+    '''
+    records = []
+    for name, placed, stage_calls, stage_run in STAGES:
+        if stages and name not in stages:
+            continue
+        for n in sizes:
+            if name == 'full_game':
+                setup = lambda: n
+                run = lambda n: play_game(n, seed=n, enemy_ai=enemy_ai)
+            else:
+                setup = lambda: _setup(n, enemy_ai, placed)
+                run = stage_run
+            times = time_stage(setup, run, min_time, max_repeat, stage_calls(n))
+            record = {'stage': name,
+                      'n': n,
+                      'repeats': len(times),
+                      'min': min(times),
+                      'median': statistics.median(times),
+                      'mean': statistics.fmean(times)}
+            records.append(record)
+            if log is not None:
+                log("{:<20} n={:<6} median {:>12.1f} us  ({} runs)".format(name, n, record['median']*1e6,
+                                                                          len(times)))
+    return records
+
+def compare(records, baseline, threshold=1.2):
+    '''
+    Compare the medians against a baseline list of records. Returns the lines
+    of the report and the number of stages that got slower than threshold.
+    '''
+    old = {(r['stage'], r['n']): r for r in baseline}
+    lines = []
+    regressions = 0
+    for record in records:
+        key = (record['stage'], record['n'])
+        if key not in old:
+            continue
+        ratio = record['median'] / old[key]['median']
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        lines.append("{:<20} n={:<6} {:>12.1f} us -> {:>12.1f} us  x{:.2f}{}".format(
+            record['stage'], record['n'], old[key]['median']*1e6, record['median']*1e6, ratio, flag))
+    return lines, regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--sizes', type=int, nargs='+', default=SIZES, help='board sizes')
+    parser.add_argument('-s', '--stages', nargs='+', choices=[s[0] for s in STAGES], help='stages to run')
+    parser.add_argument('--enemy-ai', default='random', help='shooting strategy used by the enemy')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds to spend on every benchmark')
+    parser.add_argument('--max-repeat', type=int, default=1000, help='maximum runs of every benchmark')
+    parser.add_argument('-o', '--output', help='file to write the JSON results to')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown ratio reported as a regression when comparing')
+    args = parser.parse_args(argv)
+
+    records = run_benchmarks(args.sizes, args.stages, args.enemy_ai, args.min_time, args.max_repeat,
+                             log=lambda line: print(line, file=sys.stderr))
+    out = {'meta': {'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'machine': platform.machine(),
+                    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'enemy_ai': args.enemy_ai},
+           'results': records}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(out, f, indent=2)
+    else:
+        json.dump(out, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        lines, regressions = compare(records, baseline, args.threshold)
+        print('\n'.join(lines), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
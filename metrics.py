@@ -0,0 +1,186 @@
+'''
+Optional instrumentation of games with counters and latency histograms.
+
+Metrics.instrument replaces the hot methods of one game instance with timed
+wrappers, so games that are not instrumented run exactly the same code as
+before and pay nothing for it. The rejection loops that are left, the random
+placement and the random shots of SparseBattleship, count their retries into
+the metrics attribute of the game when it is set.
+
+Example:
+    from metrics import Metrics
+    from simulation import simulate
+    metrics = Metrics()
+    simulate(1000, seed=1, metrics=metrics)
+    print(metrics.to_prometheus())
+    metrics.dump('run.json')
+'''
+import json
+import time
+from bisect import bisect_left
+
+# upper bounds of the histogram buckets in seconds
+# doubling from one microsecond to about 17 seconds, the last bucket is unbounded
+BUCKETS = [1e-6 * 2**i for i in range(25)]
+
+# methods timed by Metrics.instrument when the game has them
+TIMED = ['auto_user_turn', 'user_turn', 'enemy_turn', '_is_game_over', '_place_enemy_ship',
+         '_place_random_user_ship', 'render_boards', 'print_board']
+
+class Histogram:
+    '''
+    Latency histogram with fixed bucket bounds.
+    counts[i] is the number of values up to bounds[i] and above the bound
+    before it, counts[-1] the number of values above the last bound.
+    '''
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = list(bounds)
+        self.counts = [0]*(len(self.bounds)+1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if other.bounds != self.bounds:
+            raise ValueError("Cannot merge histograms with different buckets")
+        self.counts = [a+b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        '''
+        Upper bound of the bucket holding the q-th quantile, the largest value
+        seen for the unbounded bucket.
+        '''
+        if not self.count:
+            return 0.0
+        rank = q*self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count,
+                'sum': self.sum,
+                'mean': self.mean,
+                'max': self.max,
+                'p50': self.quantile(0.5),
+                'p90': self.quantile(0.9),
+                'p99': self.quantile(0.99),
+                'bounds': self.bounds,
+                'counts': self.counts}
+
+class Metrics:
+    '''
+    Named counters and latency histograms of one run or batch.
+    Metrics of several batches, i.e. the shards of parallel_simulate, are
+    combined with merge.
+    '''
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def count(self, name, k=1):
+        self.counters[name] = self.counters.get(name, 0) + k
+
+    def histogram(self, name):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram()
+        return self.histograms[name]
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    def timed(self, name, func):
+        '''
+        Wrap func so that the duration of every call goes into the histogram
+        of the given name. The histogram is only made by the first call so
+        that methods that never run do not show up in the output.
+        '''
+        observe = None
+        perf_counter = time.perf_counter
+        def wrapper(*args, **kwargs):
+            nonlocal observe
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                if observe is None:
+                    observe = self.histogram(name).observe
+                observe(elapsed)
+        return wrapper
+
+    def instrument(self, game):
+        '''
+        Time the TIMED methods of a Battleship or SparseBattleship instance
+        and let it count its retries into these metrics. Only this instance is
+        changed, the wrappers are set as instance attributes that hide the
+        methods of the class.
+        '''
+        for name in TIMED:
+            method = getattr(game, name, None)
+            if method is not None:
+                setattr(game, name, self.timed(name.lstrip('_'), method))
+        game.metrics = self
+        return game
+
+    def merge(self, other):
+        for name, value in other.counters.items():
+            self.count(name, value)
+        for name, histogram in other.histograms.items():
+            self.histogram(name).merge(histogram)
+        return self
+
+    def to_dict(self):
+        return {'counters': dict(self.counters),
+                'histograms': {name: h.to_dict() for name, h in self.histograms.items()}}
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self, prefix='battleship'):
+        '''
+        Text exposition format of Prometheus. Histograms are in seconds and
+        their buckets are cumulative as Prometheus expects.
+        '''
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            metric = '{}_{}_total'.format(prefix, name)
+            lines.append('# TYPE {} counter'.format(metric))
+            lines.append('{} {}'.format(metric, value))
+        for name, h in sorted(self.histograms.items()):
+            metric = '{}_{}_seconds'.format(prefix, name)
+            lines.append('# TYPE {} histogram'.format(metric))
+            total = 0
+            for bound, count in zip(h.bounds, h.counts):
+                total += count
+                lines.append('{}_bucket{{le="{:g}"}} {}'.format(metric, bound, total))
+            lines.append('{}_bucket{{le="+Inf"}} {}'.format(metric, h.count))
+            lines.append('{}_sum {!r}'.format(metric, h.sum))
+            lines.append('{}_count {}'.format(metric, h.count))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        '''
+        Write the metrics to path, in the Prometheus text format when it ends
+        with .prom and as JSON otherwise.
+        '''
+        with open(path, 'w') as f:
+            f.write(self.to_prometheus() if path.endswith('.prom') else self.to_json() + '\n')
@@ -0,0 +1,171 @@
+'''
+Compact binary records of played games.
+
+A record file starts with a header of HEADER_SIZE bytes followed by fixed-width
+records of RECORD_DTYPE, one for the start of every game, one for every ship
+placed, one for every shot and one for the end of every game. RecordWriter
+appends records through a buffer and RecordReader maps the file into memory
+so that the fields of millions of games are numpy views of the file.
+
+Example:
+    from records import RecordWriter, RecordReader, SHOT
+    with RecordWriter('games.bsr') as writer:
+        battle.recorder = writer.new_game(10)
+        ...
+    reader = RecordReader('games.bsr')
+    shots = reader.records[reader.records['kind'] == SHOT]
+'''
+import os
+import struct
+import numpy as np
+from battleship import USER, ENEMY
+
+MAGIC = b'BSHIPREC'
+VERSION = 1
+
+# record kinds
+GAME = 0
+PLACE = 1
+SHOT = 2
+END = 3
+
+# game is the id of the game the record belongs to
+# for GAME records row is the size of the board
+# for PLACE records code is the ship, row and col its anchor, flag the
+# direction and size its size
+# for SHOT records turn is the shot number of the player, row and col the cell
+# that was struck, code the ship that was hit or MISS and flag 1 if it sunk
+# for END records player is the winner and turn the number of turns
+RECORD_DTYPE = np.dtype([('game', '<u4'), ('kind', 'u1'), ('player', 'u1'), ('code', 'u1'), ('flag', 'u1'),
+                         ('row', '<u4'), ('col', '<u4'), ('size', '<u4'), ('turn', '<u4')])
+_RECORD = struct.Struct('<IBBBBIIII')
+# the header is as long as a record so that the records stay aligned
+HEADER_SIZE = RECORD_DTYPE.itemsize
+_HEADER = struct.Struct('<8sHH{}x'.format(HEADER_SIZE-12))
+
+class GameRecorder:
+    '''
+    Records the events of one game into a RecordWriter.
+    Battleship calls it through its recorder attribute.
+    '''
+    def __init__(self, writer, game):
+        self.writer = writer
+        self.game = game
+
+    def place(self, player, code, row, col, direc, size):
+        self.writer.append(self.game, PLACE, player, code, direc, row, col, size, 0)
+
+    def shot(self, player, turn, row, col, code, sunk):
+        self.writer.append(self.game, SHOT, player, code, int(sunk), row, col, 0, turn)
+
+    def end(self, winner, turns):
+        self.writer.append(self.game, END, winner, 0, 0, 0, 0, 0, turns)
+
+class RecordWriter:
+    '''
+    Streaming writer of a record file.
+    Records are packed into a buffer of buffer_records records that is written
+    out when it is full, on flush and on close. Opening an existing file
+    appends to it with game ids following the ones already in it.
+    '''
+    def __init__(self, path, buffer_records=65536):
+        self.path = path
+        self.next_game = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            reader = RecordReader(path)
+            if len(reader):
+                self.next_game = int(reader.records['game'].max()) + 1
+            del reader
+            self.file = open(path, 'ab')
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(_HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize))
+        self.buffer = bytearray(buffer_records*RECORD_DTYPE.itemsize)
+        self.offset = 0
+
+    def append(self, game, kind, player, code, flag, row, col, size, turn):
+        if self.offset == len(self.buffer):
+            self.flush()
+        _RECORD.pack_into(self.buffer, self.offset, game, kind, player, code, flag, row, col, size, turn)
+        self.offset += _RECORD.size
+
+    def new_game(self, n):
+        '''
+        Start a new game on an n x n board and return its GameRecorder.
+        '''
+        game = self.next_game
+        self.next_game += 1
+        self.append(game, GAME, 0, 0, 0, n, n, 0, 0)
+        return GameRecorder(self, game)
+
+    def flush(self):
+        self.file.write(memoryview(self.buffer)[:self.offset])
+        self.offset = 0
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class RecordReader:
+    '''
+    Memory-mapped reader of a record file.
+    records is a structured array mapped onto the file, so its fields and
+    slices are views that are only read from disk when they are used.
+    '''
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError("{} is not a record file".format(path))
+        magic, version, itemsize = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("{} is not a record file".format(path))
+        if version != VERSION or itemsize != RECORD_DTYPE.itemsize:
+            raise ValueError("Unsupported record file version {}".format(version))
+        count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+        else:
+            # numpy can not map an empty file
+            self.records = np.empty(0, dtype=RECORD_DTYPE)
+        self._starts = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, field):
+        '''
+        View of one field of all of the records, i.e. reader['row'].
+        '''
+        return self.records[field]
+
+    @property
+    def starts(self):
+        '''
+        Index of the GAME record of every game in the file.
+        '''
+        if self._starts is None:
+            self._starts = np.flatnonzero(self.records['kind'] == GAME)
+        return self._starts
+
+    @property
+    def games(self):
+        return len(self.starts)
+
+    def game(self, i):
+        '''
+        View of the records of the i-th game in the file.
+        Only valid when the games were written one after the other like
+        simulate and the command line do.
+        '''
+        starts = self.starts
+        end = starts[i+1] if i+1 < len(starts) else len(self.records)
+        return self.records[starts[i]:end]
@@ -0,0 +1,252 @@
+'''
+Scripted games without any prompts.
+
+A script is read in one go from a file or from stdin and every game in it is
+played with the non-interactive Battleship.place_ship and Battleship.fire.
+The results are written as JSON lines, one object per event, so that suites
+of scripts can be checked or replayed by other programs.
+
+Usage:
+    python script.py game.txt
+    cat games.txt | python script.py - -o results.jsonl
+    python battleship.py --script=game.txt
+
+Script format, one command per line, # starts a comment:
+    size <n>                    settings of the next games, they have to come
+    seed <seed>                 before the first move of a game
+    fleet <spec>                ships of both players, e.g. C=5,b=4,c=3,s=3,d=2x2
+    enemy-ai <name>             random, density, hunt, or script when the enemy
+    user-ai <name>              only shoots with enemy-fire
+    place <ship> <row> <col> <dir>
+                                place a user ship, dir 0 is horizontal and 1 vertical
+    enemy-place <ship> <row> <col> <dir>
+                                place an enemy ship
+    random                      place the remaining user ships at random
+    fire <row> <col>            user shot, answered by the enemy strategy
+    enemy-fire <row> <col>      enemy shot
+    auto                        user shot chosen by the user strategy
+    play                        automated turns until the game is over
+    board                       write the user and the guess board
+    new                         finish the game and start the next one
+The ships that are not placed when the first shot is fired are placed at
+random. Every event has the number of the game and the line of the script:
+    {"event": "start", "n": 10, "seed": 1, ...}
+    {"event": "place", "player": "user", "ship": "C", "row": 0, "col": 0, "dir": 0}
+    {"event": "shot", "player": "user", "row": 3, "col": 4, "result": "hit", "ship": "Carrier", "sunk": false}
+    {"event": "end", "winner": "user", "user_shots": 40, "enem_shots": 39}
+    {"event": "error", "message": "..."}
+The exit code is 1 if any line was an error.
+'''
+import argparse
+import json
+import sys
+from battleship import Battleship, Fleet, MISS, FIRST_SHIP, DEFAULT_FLEET, SILENT, STRATEGIES, USER, ENEMY
+
+PLAYERS = {USER: 'user', ENEMY: 'enemy'}
+
+class ScriptRunner:
+    '''
+    Plays the lines of a script and writes the events to out.
+    '''
+    def __init__(self, out):
+        self.out = out
+        self.errors = 0
+        self.games = 0
+        self.line = 0
+        self.battle = None
+        self.n = 10
+        self.fleet = DEFAULT_FLEET
+        self.seed = None
+        self.enemy_ai = 'random'
+        self.user_ai = 'random'
+        self.scripted_enemy = False
+
+    def emit(self, event, **fields):
+        record = {'game': self.games, 'line': self.line, 'event': event}
+        record.update(fields)
+        self.out.write(json.dumps(record) + '\n')
+
+    def _game(self):
+        # the game is only created by its first move so that the settings
+        # can come first
+        if self.battle is None:
+            self.battle = Battleship(self.n, verbose=SILENT, seed=self.seed, enemy_ai=self.enemy_ai,
+                                     user_ai=self.user_ai, fleet=self.fleet)
+            self.battle.auto = True
+            self.emit('start', n=self.n, seed=self.seed, enemy_ai='script' if self.scripted_enemy else self.enemy_ai,
+                      user_ai=self.user_ai)
+        return self.battle
+
+    def _fill_fleets(self, battle):
+        # place whatever has not been placed at random before the first shot
+        for player in (USER, ENEMY):
+            self._place_random(battle, player)
+
+    def _place_random(self, battle, player):
+        for code, row, col, direc in battle.place_random_ships(player):
+            self.emit('place', player=PLAYERS[player], ship=battle.fleet.labels[code-FIRST_SHIP], row=row, col=col,
+                      dir=direc)
+
+    def _over(self, battle):
+        # the hit points are also 0 before the ships are placed
+        return bool(battle.user_shots or battle.enem_shots) and (battle.user_hp == 0 or battle.enem_hp == 0)
+
+    def _fire(self, player, row, col):
+        battle = self.battle
+        if self._over(battle):
+            raise ValueError("The game is over, start the next one with new")
+        code, sunk = battle.fire(player, row, col)
+        self.emit('shot', player=PLAYERS[player], row=row, col=col, result='miss' if code == MISS else 'hit',
+                  ship=None if code == MISS else battle.fleet.names[code], sunk=sunk)
+        if self._over(battle):
+            self.emit('end', winner='user' if battle.enem_hp == 0 else 'enemy', user_shots=battle.user_shots,
+                      enem_shots=battle.enem_shots)
+
+    def _strategy_shot(self, player):
+        battle = self.battle
+        if player == USER:
+            cell = battle.user_ai.choose(battle.user_guess, battle.user_untried, battle.rng)
+        else:
+            cell = battle.enemy_ai.choose(battle.enem_guess, battle.enem_untried, battle.rng)
+        self._fire(player, *divmod(cell, battle.n+1))
+
+    def _user_shot(self, row=None, col=None):
+        battle = self._game()
+        if not (battle.fleet_placed(USER) and battle.fleet_placed(ENEMY)):
+            self._fill_fleets(battle)
+        if row is None:
+            self._strategy_shot(USER)
+        else:
+            self._fire(USER, row, col)
+        if not self.scripted_enemy and not self._over(battle):
+            self._strategy_shot(ENEMY)
+
+    def _ints(self, words, count):
+        if len(words) != count:
+            raise ValueError("Expected {} numbers but got {}".format(count, len(words)))
+        try:
+            return [int(w) for w in words]
+        except ValueError:
+            raise ValueError("Expected numbers but got {}".format(' '.join(words)))
+
+    def _setting(self, cmd, args):
+        if self.battle is not None:
+            raise ValueError("{} has to come before the first move of a game".format(cmd))
+        if len(args) != 1:
+            raise ValueError("Usage: {} <value>".format(cmd))
+        if cmd == 'size':
+            n = self._ints(args, 1)[0]
+            self.fleet.check(n)
+            self.n = n
+        elif cmd == 'fleet':
+            fleet = Fleet.parse(args[0])
+            fleet.check(self.n)
+            self.fleet = fleet
+        elif cmd == 'seed':
+            self.seed = self._ints(args, 1)[0]
+        elif cmd == 'enemy-ai' and args[0] == 'script':
+            self.scripted_enemy = True
+        elif args[0] not in STRATEGIES:
+            raise ValueError("Unknown strategy {}, choose one of {}".format(args[0], ', '.join(STRATEGIES)))
+        elif cmd == 'enemy-ai':
+            self.enemy_ai = args[0]
+            self.scripted_enemy = False
+        else:
+            self.user_ai = args[0]
+
+    def run_line(self, text):
+        '''
+        Play one line of a script, raises ValueError for bad lines.
+        '''
+        words = text.split('#', 1)[0].split()
+        if not words:
+            return
+        cmd, args = words[0].lower(), words[1:]
+        if cmd in ('size', 'fleet', 'seed', 'enemy-ai', 'user-ai'):
+            self._setting(cmd, args)
+        elif cmd in ('place', 'enemy-place'):
+            if len(args) != 4:
+                raise ValueError("Usage: {} <ship> <row> <col> <dir>".format(cmd))
+            battle = self._game()
+            player = USER if cmd == 'place' else ENEMY
+            if battle.user_shots or battle.enem_shots:
+                raise ValueError("The ships can not be placed once the shooting has started")
+            row, col, direc = self._ints(args[1:], 3)
+            battle.place_ship(player, args[0], row, col, direc)
+            self.emit('place', player=PLAYERS[player], ship=args[0], row=row, col=col, dir=direc)
+        elif cmd == 'random':
+            self._place_random(self._game(), USER)
+        elif cmd == 'fire':
+            self._user_shot(*self._ints(args, 2))
+        elif cmd == 'auto':
+            self._user_shot()
+        elif cmd == 'play':
+            battle = self._game()
+            if self._over(battle):
+                raise ValueError("The game is over, start the next one with new")
+            if self.scripted_enemy:
+                raise ValueError("play needs an enemy strategy")
+            while not self._over(battle):
+                self._user_shot()
+        elif cmd == 'enemy-fire':
+            row, col = self._ints(args, 2)
+            battle = self._game()
+            if not (battle.fleet_placed(USER) and battle.fleet_placed(ENEMY)):
+                self._fill_fleets(battle)
+            self._fire(ENEMY, row, col)
+        elif cmd == 'board':
+            battle = self._game()
+            chars = battle.fleet.chars
+            self.emit('board', user=[''.join(row) for row in chars[battle.user_board]],
+                      guess=[''.join(row) for row in chars[battle.user_guess]])
+        elif cmd == 'new':
+            self.finish()
+        else:
+            raise ValueError("Unknown command {}".format(words[0]))
+
+    def finish(self):
+        '''
+        End the current game, the next move starts a new one with the same
+        settings.
+        '''
+        if self.battle is not None:
+            self.games += 1
+        self.battle = None
+
+    def run(self, text):
+        '''
+        Play a whole script and return the number of lines that were errors.
+        '''
+        for self.line, line in enumerate(text.splitlines(), 1):
+            try:
+                self.run_line(line)
+            except ValueError as e:
+                self.errors += 1
+                self.emit('error', message=str(e).replace('\n', ' '))
+        return self.errors
+
+def run_script(path, out=None):
+    '''
+    Play the script in path, - for stdin, and write the events to out,
+    stdout by default. Returns the exit code.
+    '''
+    if path == '-':
+        text = sys.stdin.read()
+    else:
+        with open(path) as f:
+            text = f.read()
+    runner = ScriptRunner(out or sys.stdout)
+    return 1 if runner.run(text) else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('script', help='script to play, - for stdin')
+    parser.add_argument('-o', '--output', help='file to write the events to instead of stdout')
+    args = parser.parse_args(argv)
+    if args.output:
+        with open(args.output, 'w') as out:
+            return run_script(args.script, out)
+    return run_script(args.script)
+
+if __name__ == '__main__':
+    sys.exit(main())
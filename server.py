@@ -0,0 +1,301 @@
+'''
+Asyncio server hosting many games of Battleship at once over a line based
+protocol.
+
+Every game is a session with its own Battleship, played by two connections
+against each other or by one connection against the CPU. All of the moves are
+resolved by the non-blocking Battleship.place_ship and Battleship.fire, which
+take microseconds, so one process and one event loop serve thousands of games.
+
+Usage:
+    python server.py                        # TCP on 127.0.0.1:8765
+    python server.py --port 9000 --max-n 30
+    python server.py --unix /tmp/battleship.sock
+
+Protocol, one command per line and one or more lines back:
+    NEW CPU [n] [ai]            new game against the CPU   -> OK GAME <id> SEAT 0
+    NEW PVP [n]                 new game against a player  -> OK GAME <id> SEAT 0
+    JOIN <id>                   take the second seat       -> OK GAME <id> SEAT 1
+    PLACE <ship> <row> <col> <dir>
+                                ship is one of C b c s d, dir 0 is horizontal
+                                and 1 is vertical          -> OK PLACED <ship>
+    RANDOM                      place the remaining ships  -> OK PLACED
+    BOARD                       own board and guess board  -> OK BOARD <rows> <rows>
+    FIRE <row> <col>            shoot at the other board   -> SHOT <row> <col> <result>
+    QUIT                        leave the game and close   -> OK BYE
+    HELP                        list the commands
+
+The result of a shot is MISS, HIT <ship name> or SUNK <ship name>. Errors are
+answered with ERR <reason>. Events are sent without being asked for:
+    JOINED                      the other player took their seat
+    START                       both fleets are placed
+    TURN                        it is your turn to fire
+    INCOMING <row> <col> <result>
+                                the other player or the CPU fired at you
+    WIN <turns> / LOSE <turns>  the game is over
+    LEFT                        the other player left the game
+Boards are sent as their rows of cell characters joined by '/'.
+'''
+import argparse
+import asyncio
+import itertools
+import sys
+from battleship import Battleship, MISS, DEFAULT_FLEET, SILENT, STRATEGIES, USER, ENEMY
+
+# largest board a client may ask for, the CPU strategies are not free on big boards
+MAX_N = 100
+
+def _result(battle, code, sunk):
+    if code == MISS:
+        return 'MISS'
+    return '{} {}'.format('SUNK' if sunk else 'HIT', battle.fleet.names[code])
+
+def _ints(words):
+    try:
+        return [int(w) for w in words]
+    except ValueError:
+        raise ValueError("Expected numbers but got {}".format(' '.join(words)))
+
+def _board_rows(battle, board):
+    return '/'.join(''.join(row) for row in battle.fleet.chars[board])
+
+class Session:
+    '''
+    One game hosted by the server.
+    Seat 0 is the user of the Battleship and seat 1 the enemy, which is played
+    by the CPU when cpu is True.
+    '''
+    def __init__(self, id, n=10, cpu=False, enemy_ai='random', seed=None):
+        self.id = id
+        self.battle = Battleship(n, verbose=SILENT, seed=seed, enemy_ai=enemy_ai)
+        self.battle.auto = True
+        self.cpu = cpu
+        # writers of the connections sitting in each seat
+        self.seats = [None, None]
+        self.turn = USER
+        self.started = False
+        self.over = False
+        if cpu:
+            self.battle.place_enemy_pieces()
+
+    def ready(self):
+        return self.battle.fleet_placed(USER) and self.battle.fleet_placed(ENEMY)
+
+    def board(self, seat):
+        if seat == USER:
+            return self.battle.user_board, self.battle.user_guess
+        return self.battle.enem_board, self.battle.enem_guess
+
+    def winner(self):
+        user_lost, enem_lost = self.battle._is_game_over()
+        if enem_lost:
+            return USER
+        if user_lost:
+            return ENEMY
+        return None
+
+class GameServer:
+    '''
+    Accepts connections and plays their commands on the sessions.
+    Nothing in here blocks, every command is resolved before the next line of
+    any connection is read.
+    '''
+    def __init__(self, max_n=MAX_N, seed=None):
+        self.max_n = max_n
+        self.seed = seed
+        self.sessions = {}
+        self._ids = itertools.count(1)
+
+    def _send(self, writer, line):
+        if writer is not None and not writer.is_closing():
+            # replies can echo the text of the client
+            writer.write((line + '\n').encode('ascii', 'replace'))
+
+    def _new_session(self, args, writer):
+        if not args or args[0].upper() not in ('CPU', 'PVP'):
+            raise ValueError("Usage: NEW CPU [n] [ai] or NEW PVP [n]")
+        cpu = args[0].upper() == 'CPU'
+        n = _ints(args[1:2])[0] if len(args) > 1 else 10
+        if not max(DEFAULT_FLEET.sizes) <= n <= self.max_n:
+            raise ValueError("The board size has to be between {} and {}".format(max(DEFAULT_FLEET.sizes),
+                                                                                 self.max_n))
+        enemy_ai = args[2] if cpu and len(args) > 2 else 'random'
+        if enemy_ai not in STRATEGIES:
+            raise ValueError("Unknown ai {}, use one of {}".format(enemy_ai, ', '.join(STRATEGIES)))
+        id = next(self._ids)
+        seed = None if self.seed is None else (self.seed << 40) | id
+        session = Session(id, n, cpu, enemy_ai, seed)
+        session.seats[USER] = writer
+        self.sessions[id] = session
+        return session
+
+    def _start(self, session):
+        session.started = True
+        for writer in session.seats:
+            self._send(writer, 'START')
+        self._send(session.seats[USER], 'TURN')
+
+    def _fire(self, session, seat, row, col):
+        if not session.started:
+            raise ValueError("The game has not started yet")
+        if session.over:
+            raise ValueError("The game is over")
+        if session.turn != seat:
+            raise ValueError("It is not your turn")
+        battle = session.battle
+        code, sunk = battle.fire(seat, row, col)
+        other = 1 - seat
+        result = _result(battle, code, sunk)
+        self._send(session.seats[seat], 'SHOT {} {} {}'.format(row, col, result))
+        self._send(session.seats[other], 'INCOMING {} {} {}'.format(row, col, result))
+        if session.winner() is None and session.cpu:
+            # the CPU answers right away, its strategies take microseconds on
+            # the boards the server allows
+            cell = battle.enemy_ai.choose(battle.enem_guess, battle.enem_untried, battle.rng)
+            row, col = divmod(cell, battle.n+1)
+            code, sunk = battle.fire(ENEMY, row, col)
+            self._send(session.seats[USER], 'INCOMING {} {} {}'.format(row, col, _result(battle, code, sunk)))
+        elif not session.cpu:
+            session.turn = other
+        winner = session.winner()
+        if winner is not None:
+            session.over = True
+            turns = battle.user_shots if winner == USER else battle.enem_shots
+            self._send(session.seats[winner], 'WIN {}'.format(turns))
+            self._send(session.seats[1-winner], 'LOSE {}'.format(turns))
+        else:
+            self._send(session.seats[session.turn], 'TURN')
+
+    def _leave(self, session, seat):
+        session.seats[seat] = None
+        if not session.over:
+            self._send(session.seats[1-seat], 'LEFT')
+            session.over = True
+        if session.seats[USER] is None and session.seats[ENEMY] is None:
+            self.sessions.pop(session.id, None)
+
+    def command(self, line, state, writer):
+        '''
+        Play one line of a connection. state is the [session, seat] of the
+        connection. Raises ValueError with the reason for bad commands.
+        Returns False when the connection should be closed.
+        '''
+        words = line.split()
+        if not words:
+            return True
+        cmd, args = words[0].upper(), words[1:]
+        session, seat = state
+        if cmd == 'HELP':
+            for line in __doc__.split('Protocol')[1].splitlines()[1:]:
+                if line.strip():
+                    self._send(writer, line)
+            return True
+        if cmd == 'QUIT':
+            self._send(writer, 'OK BYE')
+            return False
+        if cmd == 'NEW' or cmd == 'JOIN':
+            if session is not None:
+                raise ValueError("You are already in game {}".format(session.id))
+            if cmd == 'NEW':
+                session = self._new_session(args, writer)
+            else:
+                if len(args) != 1:
+                    raise ValueError("Usage: JOIN <id>")
+                session = self.sessions.get(_ints(args)[0])
+                if session is None or session.cpu or session.seats[ENEMY] is not None or session.over:
+                    raise ValueError("There is no open game {}".format(args[0]))
+                session.seats[ENEMY] = writer
+                self._send(session.seats[USER], 'JOINED')
+            state[:] = session, (USER if cmd == 'NEW' else ENEMY)
+            self._send(writer, 'OK GAME {} SEAT {}'.format(session.id, state[1]))
+            return True
+        if session is None:
+            raise ValueError("Start a game with NEW or JOIN first")
+        if cmd == 'PLACE':
+            if len(args) != 4:
+                raise ValueError("Usage: PLACE <ship> <row> <col> <dir>")
+            if session.started:
+                raise ValueError("The ships can not be moved once the game has started")
+            session.battle.place_ship(seat, args[0], *_ints(args[1:]))
+            self._send(writer, 'OK PLACED {}'.format(args[0]))
+        elif cmd == 'RANDOM':
+            if session.started:
+                raise ValueError("The ships can not be moved once the game has started")
+            session.battle.place_random_ships(seat)
+            self._send(writer, 'OK PLACED')
+        elif cmd == 'BOARD':
+            own, guess = session.board(seat)
+            self._send(writer, 'OK BOARD {} {}'.format(_board_rows(session.battle, own),
+                                                       _board_rows(session.battle, guess)))
+            return True
+        elif cmd == 'FIRE':
+            if len(args) != 2:
+                raise ValueError("Usage: FIRE <row> <col>")
+            self._fire(session, seat, *_ints(args))
+            return True
+        else:
+            raise ValueError("Unknown command {}, try HELP".format(words[0]))
+        if not session.started and session.ready():
+            self._start(session)
+        return True
+
+    async def handle(self, reader, writer):
+        '''
+        Serve one connection until it quits or goes away.
+        '''
+        state = [None, None]
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # the line was longer than the stream limit
+                    self._send(writer, 'ERR Line too long')
+                    break
+                if not line:
+                    break
+                try:
+                    # only ascii commands are understood
+                    keep = self.command(line.decode('ascii'), state, writer)
+                except UnicodeDecodeError:
+                    self._send(writer, 'ERR Commands have to be ASCII')
+                    keep = True
+                except ValueError as e:
+                    self._send(writer, 'ERR {}'.format(str(e).replace('\n', ' ')))
+                    keep = True
+                await writer.drain()
+                if not keep:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            if state[0] is not None:
+                self._leave(state[0], state[1])
+            writer.close()
+
+async def serve(host='127.0.0.1', port=8765, unix=None, max_n=MAX_N, seed=None):
+    game_server = GameServer(max_n, seed)
+    if unix:
+        server = await asyncio.start_unix_server(game_server.handle, unix, limit=1024)
+    else:
+        server = await asyncio.start_server(game_server.handle, host, port, limit=1024)
+    for sock in server.sockets:
+        print("Serving Battleship on {}".format(sock.getsockname()), file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on')
+    parser.add_argument('--unix', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--max-n', type=int, default=MAX_N, help='largest board size clients may ask for')
+    parser.add_argument('--seed', type=int, help='seed to make the games reproducible')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.max_n, args.seed))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,443 @@
+'''
+Headless simulation of automated battleship games.
+
+The games are played with the same auto_user_turn and enemy_turn methods as the
+-a flag but without any printing. The result of a batch is a set of aggregate
+statistics rather than the transcript of every game.
+
+Example:
+    from battleship import Fleet
+    from simulation import simulate, parallel_simulate
+    result = simulate(100000, n=10, seed=42)
+    print(result.summary())
+    # same games spread over all of the cpu cores
+    result = parallel_simulate(100000, n=10, seed=42)
+    # bigger board with more ships
+    result = simulate(10000, n=20, seed=42, fleet=Fleet.parse("C=5,b=4x2,c=3x2,d=2x4"))
+    # many games at once as numpy arrays
+    result = simulate_lockstep(1000000, n=10, seed=42)
+'''
+import os
+import random
+import numpy as np
+from battleship import Battleship, free_placements, MISS, HIT, FIRST_SHIP, DEFAULT_FLEET, PLACEMENT_ATTEMPTS
+
+# simulate_lockstep plays about this many cells per chunk by default, which is
+# 10000 games of 10x10 and keeps a chunk at a few dozen MB whatever the size
+LOCKSTEP_CELLS = 1000000
+
+class SimulationResult:
+    '''
+    Aggregate statistics of a batch of automated games.
+    '''
+    def __init__(self, n=10, fleet=None):
+        self.n = n
+        self.fleet = fleet or DEFAULT_FLEET
+        codes = len(self.fleet.code_sizes)
+        self.games = 0
+        self.user_wins = 0
+        self.enem_wins = 0
+        # turns_to_win[t] holds the number of games that were won after t turns
+        # there can never be more turns than cells on the board
+        self.turns_to_win = np.zeros(n*n+1, dtype=np.int64)
+        # total number of shots each player needed to sink the opposing ships and
+        # how many times each of them was sunk indexed by cell code
+        self.user_sink_shots = np.zeros(codes, dtype=np.int64)
+        self.user_sink_count = np.zeros(codes, dtype=np.int64)
+        self.enem_sink_shots = np.zeros(codes, dtype=np.int64)
+        self.enem_sink_count = np.zeros(codes, dtype=np.int64)
+
+    def record(self, battle):
+        '''
+        Add the statistics of a finished game.
+        '''
+        self.games += 1
+        if battle.enem_hp == 0:
+            self.user_wins += 1
+        else:
+            self.enem_wins += 1
+        # the user always shoots first so the number of turns is the number of
+        # shots fired by the user
+        self.turns_to_win[battle.user_shots] += 1
+        for code in self.fleet.codes:
+            # shots the user needed to sink the enemy ships
+            if battle.enem_sunk_at[code]:
+                self.user_sink_shots[code] += battle.enem_sunk_at[code]
+                self.user_sink_count[code] += 1
+            # shots the enemy needed to sink the user ships
+            if battle.user_sunk_at[code]:
+                self.enem_sink_shots[code] += battle.user_sunk_at[code]
+                self.enem_sink_count[code] += 1
+
+    def record_batch(self, batch):
+        '''
+        Add the statistics of all the games in a finished BatchBattleship.
+        '''
+        self.games += batch.k
+        user_wins = int(np.count_nonzero(batch.enem_hp == 0))
+        self.user_wins += user_wins
+        self.enem_wins += batch.k - user_wins
+        self.turns_to_win += np.bincount(batch.user_shots, minlength=len(self.turns_to_win))
+        self.user_sink_shots += batch.enem_sunk_at.sum(axis=0)
+        self.user_sink_count += np.count_nonzero(batch.enem_sunk_at, axis=0)
+        self.enem_sink_shots += batch.user_sunk_at.sum(axis=0)
+        self.enem_sink_count += np.count_nonzero(batch.user_sunk_at, axis=0)
+
+    def merge(self, other):
+        '''
+        Add the statistics of another batch played on the same board size with
+        the same fleet.
+        '''
+        if other.n != self.n:
+            raise ValueError("Cannot merge results of {} x {} and {} x {} boards".format(self.n, self.n,
+                                                                                        other.n, other.n))
+        if other.fleet != self.fleet:
+            raise ValueError("Cannot merge results of different fleets")
+        self.games += other.games
+        self.user_wins += other.user_wins
+        self.enem_wins += other.enem_wins
+        self.turns_to_win += other.turns_to_win
+        self.user_sink_shots += other.user_sink_shots
+        self.user_sink_count += other.user_sink_count
+        self.enem_sink_shots += other.enem_sink_shots
+        self.enem_sink_count += other.enem_sink_count
+        return self
+
+    @property
+    def user_win_rate(self):
+        return self.user_wins / self.games if self.games else 0.0
+
+    @property
+    def enem_win_rate(self):
+        return self.enem_wins / self.games if self.games else 0.0
+
+    @property
+    def mean_turns(self):
+        if not self.games:
+            return 0.0
+        return float(np.dot(np.arange(len(self.turns_to_win)), self.turns_to_win) / self.games)
+
+    def shots_per_ship(self):
+        '''
+        Average number of shots that were needed to sink every ship.
+        Returns a dictionary of ship label, followed by its number when the fleet
+        has several ships of its type, to a tuple with the average for the user
+        and the enemy.
+        '''
+        out = {}
+        for code in self.fleet.codes:
+            user = self.user_sink_shots[code] / self.user_sink_count[code] if self.user_sink_count[code] else 0.0
+            enem = self.enem_sink_shots[code] / self.enem_sink_count[code] if self.enem_sink_count[code] else 0.0
+            out[self.fleet.ids[code]] = (float(user), float(enem))
+        return out
+
+    def summary(self):
+        '''
+        Plain dictionary of the statistics that can be printed or dumped to JSON.
+        '''
+        # drop the trailing zeros of the distribution
+        last = np.flatnonzero(self.turns_to_win)
+        last = last[-1]+1 if len(last) else 0
+        return {'n': self.n,
+                'games': self.games,
+                'user_wins': self.user_wins,
+                'enem_wins': self.enem_wins,
+                'user_win_rate': self.user_win_rate,
+                'enem_win_rate': self.enem_win_rate,
+                'mean_turns': self.mean_turns,
+                'turns_to_win': self.turns_to_win[:last].tolist(),
+                'shots_per_ship': self.shots_per_ship()}
+
+def game_seed(seed, index):
+    '''
+    Seed of a single game in a batch.
+    It only depends on the batch seed and the index of the game so that any
+    game can be replayed on its own.
+    '''
+    return (seed << 40) | index
+
+def play_game(n=10, seed=None, enemy_ai='random', user_ai='random', writer=None, metrics=None, fleet=None):
+    '''
+    Play a single automated game without any output and return the finished
+    Battleship instance. The game is recorded when a records.RecordWriter is
+    given and instrumented when a metrics.Metrics is given. Both players place
+    fleet, the classic five ships by default.
+    '''
+    battle = Battleship(n, verbose=False, seed=seed, enemy_ai=enemy_ai, user_ai=user_ai, fleet=fleet)
+    battle.auto = True
+    if writer is not None:
+        battle.recorder = writer.new_game(n)
+    if metrics is not None:
+        metrics.instrument(battle)
+        metrics.count('games')
+    battle.place_enemy_pieces()
+    battle.random_user_board()
+    # the end of the game is checked with _is_game_over like the terminal
+    # game so that it gets timed when the game is instrumented
+    while True:
+        battle.auto_user_turn()
+        if battle._is_game_over()[1]:
+            break
+        battle.enemy_turn()
+        if battle._is_game_over()[0]:
+            break
+    battle.record_result()
+    return battle
+
+def simulate(games, n=10, seed=None, start=0, enemy_ai='random', user_ai='random', writer=None, metrics=None,
+             fleet=None):
+    '''
+    Play a batch of automated games on n x n boards with the given fleet and
+    return their SimulationResult. Every game is recorded when a
+    records.RecordWriter is given and its timings and counters go into metrics
+    when a metrics.Metrics is given.
+
+    Game i of the batch is seeded from the batch seed and start+i so the
+    batch can be split into pieces that give the same result when merged.
+    A random batch seed is chosen when none is given.
+    '''
+    if seed is None:
+        seed = random.getrandbits(32)
+    result = SimulationResult(n, fleet)
+    for index in range(start, start+games):
+        result.record(play_game(n, game_seed(seed, index), enemy_ai, user_ai, writer, metrics, fleet))
+    return result
+
+def _simulate_shard(args):
+    '''
+    Worker function of parallel_simulate. Takes a single tuple so that it can
+    be used with map. Returns the result and the metrics of the shard, which
+    are None when measure is False.
+    '''
+    games, n, seed, start, enemy_ai, user_ai, measure, fleet = args
+    metrics = None
+    if measure:
+        from metrics import Metrics
+        metrics = Metrics()
+    return simulate(games, n, seed, start, enemy_ai, user_ai, metrics=metrics, fleet=fleet), metrics
+
+def parallel_simulate(games, n=10, seed=None, workers=None, shards=None, enemy_ai='random', user_ai='random',
+                      metrics=None, fleet=None):
+    '''
+    Play a batch of automated games on a pool of processes and return the
+    merged SimulationResult.
+
+    The batch is cut into shards of consecutive games and every shard is played
+    with simulate using the same batch seed. As the seed of every game only
+    depends on the batch seed and its index the result is the same as
+    simulate(games, n, seed, fleet=fleet) for any number of workers or shards.
+    workers defaults to the number of cpu cores and shards to four per worker
+    so that slow shards do not leave the other cores idle at the end.
+    The metrics of the shards are merged into metrics when it is given.
+    '''
+    if seed is None:
+        seed = random.getrandbits(32)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if shards is None:
+        shards = workers*4
+    shards = max(1, min(shards, games))
+    # split the games as evenly as possible
+    size, extra = divmod(games, shards)
+    tasks = []
+    start = 0
+    for i in range(shards):
+        count = size + (1 if i < extra else 0)
+        tasks.append((count, n, seed, start, enemy_ai, user_ai, metrics is not None, fleet))
+        start += count
+    result = SimulationResult(n, fleet)
+    if workers == 1:
+        shards = [_simulate_shard(task) for task in tasks]
+    else:
+        # only pay for the import when a pool is needed
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            shards = list(pool.map(_simulate_shard, tasks))
+    for shard, shard_metrics in shards:
+        result.merge(shard)
+        if metrics is not None:
+            metrics.merge(shard_metrics)
+    return result
+
+class BatchBattleship:
+    '''
+    A batch of k automated games played in lockstep.
+
+    The boards of all the games are stacked into (k, n, n) uint8 arrays with the
+    same cell codes as Battleship. Every step fires one shot per player in every
+    game that is still running as a handful of array operations, so the cost of
+    a step depends on the size of the arrays rather than the number of games.
+    '''
+    def __init__(self, k, n=10, seed=None, fleet=None):
+        self.k = k
+        self.n = n
+        self.fleet = fleet or DEFAULT_FLEET
+        self.fleet.check(n)
+        # ship sizes indexed by cell code for the array operations
+        self.code_sizes = np.array(self.fleet.code_sizes)
+        codes = len(self.code_sizes)
+        self.rng = np.random.default_rng(seed)
+        shape = (k, n, n)
+        self.user_board = np.zeros(shape, dtype=np.uint8)
+        self.user_guess = np.zeros(shape, dtype=np.uint8)
+        self.enem_board = np.zeros(shape, dtype=np.uint8)
+        self.enem_guess = np.zeros(shape, dtype=np.uint8)
+        # same counters as Battleship with one row per game
+        self.user_hp = np.zeros(k, dtype=np.int64)
+        self.enem_hp = np.zeros(k, dtype=np.int64)
+        self.user_ship_hits = np.zeros((k, codes), dtype=np.int64)
+        self.enem_ship_hits = np.zeros((k, codes), dtype=np.int64)
+        self.user_shots = np.zeros(k, dtype=np.int64)
+        self.enem_shots = np.zeros(k, dtype=np.int64)
+        self.user_sunk_at = np.zeros((k, codes), dtype=np.int64)
+        self.enem_sunk_at = np.zeros((k, codes), dtype=np.int64)
+        # the random shooters never hit the same cell twice so the shots of every
+        # game are a random permutation of the cells. The cell numbers fit in 16
+        # bits on any board up to 255x255, a quarter of the memory of int64
+        dtype = np.uint16 if n*n < 65536 else np.int32
+        self.user_order = self._shuffled_cells(dtype)
+        self.enem_order = self._shuffled_cells(dtype)
+        # games that are still being played
+        self.active = np.ones(k, dtype=bool)
+
+    def _shuffled_cells(self, dtype):
+        '''
+        A (k, n*n) array where every row is a random permutation of the cells.
+        '''
+        order = np.empty((self.k, self.n*self.n), dtype=dtype)
+        order[:] = np.arange(self.n*self.n, dtype=dtype)
+        return self.rng.permuted(order, axis=1, out=order)
+
+    def _place_fleet(self, boards):
+        '''
+        Randomly place the fleet on every one of the given empty boards.
+        Like Battleship every ship goes on one of its legal placements chosen
+        uniformly, found for all of the boards at once with free_placements.
+        Returns the mask of the boards that got the whole fleet, the others
+        ran out of room and are left half full.
+        '''
+        k, n = boards.shape[0], self.n
+        flat = boards.reshape(k, n*n)
+        ok = np.ones(k, dtype=bool)
+        # largest ship first like Battleship.place_random_ships
+        for code in sorted(self.fleet.codes, key=lambda code: -self.code_sizes[code]):
+            size = self.fleet.code_sizes[code]
+            horizontal, vertical = free_placements(boards >= FIRST_SHIP, size)
+            # number of horizontal placements on a board
+            split = n*(n-size+1)
+            legal = np.concatenate([horizontal.reshape(k, -1), vertical.reshape(k, -1)], axis=1)
+            if size == 1:
+                # both directions give the same placements for ships of size one
+                legal[:, split:] = False
+            counts = np.cumsum(legal, axis=1)
+            ok &= counts[:, -1] > 0
+            games = np.flatnonzero(ok)
+            if not len(games):
+                break
+            counts = counts[games]
+            # index of the chosen placement among the legal ones of every game
+            choice = self.rng.integers(0, counts[:, -1])
+            pick = np.argmax(counts > choice[:,None], axis=1)
+            # translate the pick to the anchor and direction
+            vert = pick >= split
+            pick = np.where(vert, pick - split, pick)
+            width = np.where(vert, n, n-size+1)
+            c1, c2 = pick // width, pick % width
+            stride = np.where(vert, n, 1)
+            cells = (c1*n + c2)[:,None] + np.arange(size)[None,:]*stride[:,None]
+            flat[games[:,None], cells] = code
+        return ok
+
+    def _place_ships(self, board, hp):
+        '''
+        Randomly place the fleet on every board of the batch. The boards that
+        run out of room are cleared and placed from scratch again, up to
+        PLACEMENT_ATTEMPTS times like Battleship.place_random_ships.
+        '''
+        games = np.arange(self.k)
+        for attempt in range(PLACEMENT_ATTEMPTS):
+            # the first attempt works on the boards themselves, the retries on
+            # empty copies of the boards that failed
+            boards = board if attempt == 0 else np.zeros((len(games), self.n, self.n), dtype=np.uint8)
+            ok = self._place_fleet(boards)
+            if attempt == 0:
+                board[~ok] = 0
+            else:
+                board[games[ok]] = boards[ok]
+            games = games[~ok]
+            if not len(games):
+                break
+        else:
+            raise ValueError("Could not place the fleet at random after {} attempts".format(PLACEMENT_ATTEMPTS))
+        hp += sum(self.fleet.sizes)
+
+    def place_pieces(self):
+        '''
+        Place the ships of both players in all of the games.
+        '''
+        self._place_ships(self.enem_board, self.enem_hp)
+        self._place_ships(self.user_board, self.user_hp)
+
+    def _fire(self, games, order, board, guess, hp, ship_hits, shots, sunk_at):
+        '''
+        Fire the next shot of the given games at the boards and record the hits.
+        '''
+        cells = order[games, shots[games]]
+        shots[games] += 1
+        flat = board.reshape(self.k, -1)
+        codes = flat[games, cells]
+        hit = codes >= FIRST_SHIP
+        marks = np.where(hit, HIT, MISS).astype(np.uint8)
+        flat[games, cells] = marks
+        guess.reshape(self.k, -1)[games, cells] = marks
+        # every game shows up at most once so plain fancy indexing is safe
+        hit_games = games[hit]
+        hit_codes = codes[hit]
+        hp[hit_games] -= 1
+        ship_hits[hit_games, hit_codes] += 1
+        sunk = ship_hits[hit_games, hit_codes] == self.code_sizes[hit_codes]
+        sunk_games = hit_games[sunk]
+        sunk_at[sunk_games, hit_codes[sunk]] = shots[sunk_games]
+
+    def step(self):
+        '''
+        One turn of every running game. The user shoots first and games that are
+        won are masked out before the enemy shoots.
+        '''
+        games = np.flatnonzero(self.active)
+        self._fire(games, self.user_order, self.enem_board, self.user_guess, self.enem_hp,
+                   self.enem_ship_hits, self.user_shots, self.enem_sunk_at)
+        self.active[games[self.enem_hp[games] == 0]] = False
+        games = np.flatnonzero(self.active)
+        self._fire(games, self.enem_order, self.user_board, self.enem_guess, self.user_hp,
+                   self.user_ship_hits, self.enem_shots, self.user_sunk_at)
+        self.active[games[self.user_hp[games] == 0]] = False
+
+    def play(self):
+        '''
+        Place the ships and step until all of the games are over.
+        '''
+        self.place_pieces()
+        while self.active.any():
+            self.step()
+        return self
+
+def simulate_lockstep(games, n=10, seed=None, batch=None, fleet=None):
+    '''
+    Play a batch of automated games with BatchBattleship and return their
+    SimulationResult.
+
+    The games are played batch at a time to bound the memory use, by default
+    as many as fit in LOCKSTEP_CELLS cells. The result is reproducible for a
+    given seed and batch but it does not match simulate as the games draw from
+    numpy generators.
+    '''
+    if batch is None:
+        batch = max(1, LOCKSTEP_CELLS // (n*n))
+    result = SimulationResult(n, fleet)
+    chunks = -(-games // batch) if games else 0
+    seeds = np.random.SeedSequence(seed).spawn(chunks)
+    for i, chunk_seed in enumerate(seeds):
+        k = min(batch, games - i*batch)
+        result.record_batch(BatchBattleship(k, n, chunk_seed, fleet).play())
+    return result
@@ -0,0 +1,242 @@
+'''
+Sparse boards for games on boards far too large for the dense arrays of
+Battleship.
+
+Only the ships and the shots are stored. Ships are kept as segments in a
+spatial hash of square buckets and the shots in a dictionary keyed by the flat
+index of the cell, so memory and the cost of placing a ship, resolving a shot
+and checking for the end of the game depend on the number of ships and shots
+rather than on the area of the board.
+
+Example:
+    from sparse import SparseBattleship
+    battle = SparseBattleship(100000, seed=1)
+    battle.place_enemy_pieces()
+    battle.random_user_board()
+    code, sunk = battle.user_fire(12345, 67890)
+'''
+import random
+from battleship import MISS, HIT, FIRST_SHIP, DEFAULT_FLEET, EVERY_TURN
+
+# times a ship is drawn at random before giving up on finding room for it, on
+# the large boards this is meant for almost every draw fits
+PLACEMENT_DRAWS = 10000
+
+class SparseBoard:
+    '''
+    Board of n x n cells that stores its ships as segments.
+
+    Every segment is registered in all of the buckets of bucket x bucket cells
+    that it touches, so finding the ship on a cell or the ships that could
+    overlap a new one only looks at the segments of one or two buckets.
+    '''
+    def __init__(self, n, bucket=64):
+        self.n = n
+        self.bucket = bucket
+        # segments as (row, column, direction, size, code)
+        # direction is 0 for horizontally and 1 for vertically
+        self.ships = []
+        # hits taken by every ship in the same order as ships
+        self.ship_hits = []
+        # bucket coordinates to the indices of the ships touching it
+        self.buckets = {}
+        # flat index of every cell shot at to HIT or MISS
+        self.shots = {}
+        # remaining hit points
+        self.hp = 0
+
+    def _bucket_keys(self, coord_1, coord_2, direc, size):
+        # all of the buckets between the first and the last cell of the segment
+        b = self.bucket
+        if direc == 0:
+            return [(coord_1 // b, col) for col in range(coord_2 // b, (coord_2+size-1) // b + 1)]
+        return [(row, coord_2 // b) for row in range(coord_1 // b, (coord_1+size-1) // b + 1)]
+
+    def ship_at(self, coord_1, coord_2):
+        '''
+        Index of the ship on the given cell or -1 if the cell is empty.
+        '''
+        for i in self.buckets.get((coord_1 // self.bucket, coord_2 // self.bucket), ()):
+            r, c, direc, size, code = self.ships[i]
+            if direc == 0:
+                if r == coord_1 and c <= coord_2 < c+size:
+                    return i
+            elif c == coord_2 and r <= coord_1 < r+size:
+                return i
+        return -1
+
+    def _check_for_existing_ship(self, coord_1, coord_2, direc, size):
+        '''
+        Same as Battleship._check_for_existing_ship, True if the ship would
+        overlap one that is already on the board.
+        '''
+        # the new ship as a rectangle of rows and columns
+        rows = (coord_1, coord_1 + (size if direc else 1))
+        cols = (coord_2, coord_2 + (1 if direc else size))
+        seen = set()
+        for key in self._bucket_keys(coord_1, coord_2, direc, size):
+            for i in self.buckets.get(key, ()):
+                if i in seen:
+                    continue
+                seen.add(i)
+                r, c, d, s, code = self.ships[i]
+                if (r < rows[1] and rows[0] < r + (s if d else 1) and
+                        c < cols[1] and cols[0] < c + (1 if d else s)):
+                    return True
+        return False
+
+    def place(self, coord_1, coord_2, direc, size, code):
+        '''
+        Add a ship to the board. The caller has to check that it fits.
+        '''
+        i = len(self.ships)
+        self.ships.append((coord_1, coord_2, direc, size, code))
+        self.ship_hits.append(0)
+        for key in self._bucket_keys(coord_1, coord_2, direc, size):
+            self.buckets.setdefault(key, []).append(i)
+        self.hp += size
+
+    def shoot(self, coord_1, coord_2):
+        '''
+        Resolve a shot on the given cell.
+        Returns the cell code of the ship that was hit or MISS and whether the
+        ship was sunk. Raises ValueError if the cell is not on the board or was
+        already struck.
+        '''
+        # the flat index of a cell off the board could be the index of another cell
+        if not (0 <= coord_1 < self.n and 0 <= coord_2 < self.n):
+            raise ValueError("The coordinates {},{} are not on the board.".format(coord_1, coord_2))
+        cell = coord_1*self.n + coord_2
+        if cell in self.shots:
+            raise ValueError("The cell {},{} has already been struck".format(coord_1, coord_2))
+        i = self.ship_at(coord_1, coord_2)
+        if i < 0:
+            self.shots[cell] = MISS
+            return MISS, False
+        self.shots[cell] = HIT
+        self.hp -= 1
+        self.ship_hits[i] += 1
+        size, code = self.ships[i][3:]
+        return code, self.ship_hits[i] == size
+
+class SparseBattleship:
+    '''
+    Automated game between two random shooters on SparseBoards.
+
+    It follows the Battleship methods used by the automated mode, apart from
+    printing the boards which would not fit on any terminal. Shots are drawn
+    uniformly from the whole board and drawn again if the cell was already
+    struck, which takes constant expected time as long as only a small part
+    of the board has been shot at.
+    '''
+    def __init__(self, n, verbose=False, seed=None, bucket=64, fleet=None):
+        self.n = n
+        # ships of both players, the classic five by default
+        self.fleet = fleet or DEFAULT_FLEET
+        self.fleet.check(n)
+        # same verbosity levels as Battleship
+        self.verbose = EVERY_TURN if verbose is True else int(verbose)
+        self.rng = random.Random(seed)
+        self.user_board = SparseBoard(n, bucket)
+        self.enem_board = SparseBoard(n, bucket)
+        self.user_shots = 0
+        self.enem_shots = 0
+        # metrics.Metrics that the retries of the rejection loops are counted
+        # into, nothing is counted when it is None
+        self.metrics = None
+
+    @property
+    def user_hp(self):
+        return self.user_board.hp
+
+    @property
+    def enem_hp(self):
+        return self.enem_board.hp
+
+    def _place_random_ship(self, board, code):
+        '''
+        Place a ship uniformly at random on one of its legal placements.
+        Both directions have as many placements so drawing the direction first
+        and then the anchor is uniform over all of them, and redrawing on an
+        overlap keeps it uniform over the legal ones.
+        Raises ValueError if none of PLACEMENT_DRAWS draws fits.
+        '''
+        size = self.fleet.code_sizes[code]
+        for retries in range(PLACEMENT_DRAWS):
+            direc = self.rng.randint(0, 1)
+            if direc == 0:
+                coord_1 = self.rng.randrange(self.n)
+                coord_2 = self.rng.randrange(self.n-size+1)
+            else:
+                coord_1 = self.rng.randrange(self.n-size+1)
+                coord_2 = self.rng.randrange(self.n)
+            if not board._check_for_existing_ship(coord_1, coord_2, direc, size):
+                board.place(coord_1, coord_2, direc, size, code)
+                if self.metrics is not None:
+                    self.metrics.count('placement_retries', retries)
+                return coord_1, coord_2, direc
+        raise ValueError("Could not find room for a ship of size {} after {} draws".format(size, PLACEMENT_DRAWS))
+
+    def _place_fleet(self, board):
+        # largest ship first like Battleship.place_random_ships
+        sizes = self.fleet.code_sizes
+        for code in sorted(self.fleet.codes, key=lambda code: -sizes[code]):
+            self._place_random_ship(board, code)
+
+    def place_enemy_pieces(self):
+        self._place_fleet(self.enem_board)
+
+    def random_user_board(self):
+        self._place_fleet(self.user_board)
+
+    def _random_untried(self, board):
+        retries = -1
+        while True:
+            retries += 1
+            cell = self.rng.randrange(self.n*self.n)
+            if cell not in board.shots:
+                if self.metrics is not None:
+                    self.metrics.count('shot_retries', retries)
+                return divmod(cell, self.n)
+
+    def user_fire(self, coord_1, coord_2):
+        '''
+        Shoot the enemy board at the given cell.
+        Returns the cell code that was hit or MISS and whether it sunk a ship.
+        Raises ValueError if the cell is off the board or was already struck,
+        the shot is not counted then.
+        '''
+        code, sunk = self.enem_board.shoot(coord_1, coord_2)
+        self.user_shots += 1
+        if self.verbose >= EVERY_TURN:
+            if code >= FIRST_SHIP:
+                print("Hurrah!!\nWe have hit the enemy {}".format(self.fleet.names[code]))
+                if sunk:
+                    print("We have sunk the enemy {}".format(self.fleet.names[code]))
+            else:
+                print("We have missed the enemy!")
+        return code, sunk
+
+    def enemy_fire(self, coord_1, coord_2):
+        '''
+        Shoot the user board at the given cell.
+        '''
+        code, sunk = self.user_board.shoot(coord_1, coord_2)
+        self.enem_shots += 1
+        if self.verbose >= EVERY_TURN:
+            if code >= FIRST_SHIP:
+                print("Oh no!!\nOur {} has been hit".format(self.fleet.names[code]))
+                if sunk:
+                    print("Our {} has been sunk".format(self.fleet.names[code]))
+            else:
+                print("The enemy has missed our ships!")
+        return code, sunk
+
+    def auto_user_turn(self):
+        return self.user_fire(*self._random_untried(self.enem_board))
+
+    def enemy_turn(self):
+        return self.enemy_fire(*self._random_untried(self.user_board))
+
+    def _is_game_over(self):
+        return self.user_hp == 0, self.enem_hp == 0
@@ -0,0 +1,177 @@
+'''
+Tests of the placement, undo, fork and restore of games. Run with
+python -m pytest.
+'''
+import pytest
+from battleship import Battleship, DensityShooter, HuntTargetShooter, Fleet, STRATEGIES, USER, ENEMY, FIRST_SHIP
+from simulation import BatchBattleship, simulate
+from sparse import SparseBattleship
+
+def strategy_state(ai):
+    if isinstance(ai, DensityShooter):
+        return ({code: hits.tobytes() for code, hits in ai.ship_hits.items()}, dict(ai.hit_count),
+                sorted(ai.afloat), ai.hash)
+    if isinstance(ai, HuntTargetShooter):
+        return (ai.hunt.cells[:], ai.hunt.pos[:], [(code, queue[:]) for code, queue in ai.targets.items()],
+                [(code, hits[:]) for code, hits in ai.hits.items()], len(ai.log))
+    return None
+
+def game_state(battle):
+    return (battle.user_board.tobytes(), battle.user_guess.tobytes(), battle.enem_board.tobytes(),
+            battle.enem_guess.tobytes(), battle.user_untried.cells[:], battle.user_untried.pos[:],
+            battle.enem_untried.cells[:], battle.enem_untried.pos[:], battle.user_hp, battle.enem_hp,
+            battle.user_ship_hits[:], battle.enem_ship_hits[:], battle.user_shots, battle.enem_shots,
+            battle.user_sunk_at[:], battle.enem_sunk_at[:], strategy_state(battle.user_ai),
+            strategy_state(battle.enemy_ai))
+
+def new_game(ai, seed=5, turns=0):
+    battle = Battleship(10, verbose=False, seed=seed, enemy_ai=ai, user_ai=ai)
+    battle.auto = True
+    battle.place_enemy_pieces()
+    battle.random_user_board()
+    for _ in range(turns):
+        battle.auto_user_turn()
+        battle.enemy_turn()
+    battle.history = []
+    return battle
+
+def untried_cells(battle, player, hit):
+    # cells of the board the player shoots at that would hit or miss
+    board = battle.enem_board if player == USER else battle.user_board
+    guess = battle.user_guess if player == USER else battle.enem_guess
+    return [divmod(cell, battle.n+1) for cell in range(board.size)
+            if guess.flat[cell] == 0 and (board.flat[cell] >= FIRST_SHIP) == hit]
+
+@pytest.mark.parametrize('ai', list(STRATEGIES))
+@pytest.mark.parametrize('hit', [False, True])
+def test_fire_undo_restores_game_and_strategies(ai, hit):
+    battle = new_game(ai, turns=15)
+    for player in (USER, ENEMY):
+        before = game_state(battle)
+        for row, col in untried_cells(battle, player, hit)[:5]:
+            battle.fire(player, row, col)
+            battle.undo()
+            assert game_state(battle) == before
+
+def test_undo_of_a_sinking_shot():
+    for ai in STRATEGIES:
+        battle = new_game(ai)
+        # sink the whole enemy fleet and take all of it back
+        states = []
+        for row, col in untried_cells(battle, USER, True):
+            states.append(game_state(battle))
+            battle.fire(USER, row, col)
+        assert battle.enem_hp == 0
+        while states:
+            battle.undo()
+            assert game_state(battle) == states.pop()
+
+@pytest.mark.parametrize('ai', list(STRATEGIES))
+def test_undo_then_play_matches_playing_without_the_shot(ai):
+    # a hit taken back and fired again leaves the strategy as if it was fired once
+    battle = new_game(ai, turns=10)
+    row, col = untried_cells(battle, USER, True)[0]
+    battle.fire(USER, row, col)
+    once = game_state(battle)
+    battle.undo()
+    battle.fire(USER, row, col)
+    assert game_state(battle) == once
+
+@pytest.mark.parametrize('ai', list(STRATEGIES))
+def test_undo_chain_of_automated_turns(ai):
+    battle = new_game(ai)
+    states = []
+    while battle.user_hp and battle.enem_hp:
+        states.append(game_state(battle))
+        battle.auto_user_turn()
+        if not battle.enem_hp:
+            break
+        states.append(game_state(battle))
+        battle.enemy_turn()
+    while battle.history:
+        battle.undo()
+        assert game_state(battle) == states.pop()
+    with pytest.raises(ValueError):
+        battle.undo()
+
+@pytest.mark.parametrize('ai', list(STRATEGIES))
+def test_undo_in_a_fork_leaves_the_parent_alone(ai):
+    battle = new_game(ai, turns=10)
+    row, col = untried_cells(battle, USER, True)[0]
+    battle.fire(USER, row, col)
+    parent = game_state(battle)
+    fork = battle.fork()
+    fork.undo()
+    fork.fire(ENEMY, *untried_cells(fork, ENEMY, True)[0])
+    assert game_state(battle) == parent
+    # both back to before the shot they shared
+    fork.undo()
+    battle.undo()
+    assert game_state(battle) == game_state(fork)
+
+@pytest.mark.parametrize('ai', list(STRATEGIES))
+def test_restore_of_a_snapshot(ai):
+    battle = new_game(ai, turns=10)
+    before = game_state(battle)
+    snapshot = battle.snapshot()
+    for _ in range(10):
+        battle.auto_user_turn()
+        battle.enemy_turn()
+    battle.restore(snapshot)
+    assert game_state(battle) == before
+
+@pytest.mark.parametrize('ai', ['density', 'hunt'])
+def test_shots_taken_back_do_not_slow_the_strategy(ai):
+    # every shot is fired, taken back and fired again, the strategy has to
+    # end up with the same game as the one that only fired once
+    plain = new_game(ai, seed=8)
+    undone = new_game(ai, seed=8)
+    while plain.enem_hp:
+        cell = plain.user_ai.choose(plain.user_guess, plain.user_untried, plain.rng)
+        plain.fire(USER, *divmod(cell, plain.n+1))
+        cell = undone.user_ai.choose(undone.user_guess, undone.user_untried, undone.rng)
+        undone.fire(USER, *divmod(cell, undone.n+1))
+        undone.undo()
+        undone.fire(USER, *divmod(cell, undone.n+1))
+    assert undone.enem_hp == 0
+    assert undone.user_shots == plain.user_shots
+    assert game_state(undone) == game_state(plain)
+
+def test_hunt_only_logs_shots_kept_in_the_history():
+    battle = new_game('hunt', turns=10)
+    assert battle.user_ai.log == [] and battle.enemy_ai.log == []
+    battle.auto_user_turn()
+    assert len(battle.user_ai.log) == 1
+
+def test_fleet_that_fills_the_board_is_placed():
+    # the largest first placement often runs out of room for the last ships
+    fleet = Fleet.parse('a=3x4,b=2x2')
+    for seed in range(20):
+        battle = Battleship(4, verbose=False, seed=seed, fleet=fleet)
+        battle.place_enemy_pieces()
+        battle.random_user_board()
+        assert battle.user_hp == battle.enem_hp == 16
+        assert (battle.user_board >= FIRST_SHIP).all() and (battle.enem_board >= FIRST_SHIP).all()
+        assert battle.fleet_placed(USER) and battle.fleet_placed(ENEMY)
+    assert simulate(20, n=4, seed=1, fleet=fleet).games == 20
+    batch = BatchBattleship(200, 4, 1, fleet)
+    batch.place_pieces()
+    assert (batch.user_board >= FIRST_SHIP).all() and (batch.enem_board >= FIRST_SHIP).all()
+    assert (batch.user_hp == 16).all()
+    for code in fleet.codes:
+        assert ((batch.user_board == code).sum(axis=(1, 2)) == fleet.code_sizes[code]).all()
+
+def test_sparse_placement_gives_up_on_a_full_board():
+    battle = SparseBattleship(4, seed=1, fleet=Fleet.parse('a=4x4'))
+    battle.place_enemy_pieces()
+    assert battle.enem_hp == 16
+    with pytest.raises(ValueError):
+        battle._place_random_ship(battle.enem_board, FIRST_SHIP)
+
+def test_fleet_parse():
+    fleet = Fleet.parse('C=5,b=4x2,z=1x0')
+    assert fleet.types == [('C', 'Carrier', 5, 1), ('b', 'Battleship', 4, 2), ('z', 'z', 1, 0)]
+    for spec in ['C=5x', 'C=x2', 'C=5,', 'C5', 'C=5x2x1']:
+        with pytest.raises(ValueError, match='Did not understand the fleet'):
+            Fleet.parse(spec)
+    assert 'Battleship | b   | 4          | 2' in fleet.table()
@@ -0,0 +1,105 @@
+'''
+Tests of the line protocol of the server. Run with python -m pytest.
+'''
+import asyncio
+import pytest
+from server import GameServer
+
+class Writer:
+    '''
+    Stand in for the StreamWriter of a connection that keeps the lines sent.
+    '''
+    def __init__(self):
+        self.data = b''
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    def is_closing(self):
+        return self.closed
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    @property
+    def lines(self):
+        return self.data.decode('ascii').splitlines()
+
+def connect(server, data):
+    # play the bytes of one connection through handle and return its writer
+    async def run():
+        reader = asyncio.StreamReader(limit=1024)
+        reader.feed_data(data)
+        reader.feed_eof()
+        writer = Writer()
+        await server.handle(reader, writer)
+        return writer
+    return asyncio.run(run())
+
+def command(server, line, state, writer):
+    try:
+        server.command(line, state, writer)
+    except ValueError as e:
+        return 'ERR {}'.format(e)
+
+def test_bad_commands_are_answered_with_err():
+    server = GameServer(seed=1)
+    writer = Writer()
+    state = [None, None]
+    assert command(server, 'FIRE 0 0', state, writer).startswith('ERR Start a game')
+    server.command('NEW PVP', state, writer)
+    assert command(server, 'BLAH', state, writer).startswith('ERR Unknown command')
+    assert command(server, 'PLACE z 0 0 0', state, writer).startswith('ERR Sorry')
+    assert command(server, 'PLACE C x 0 0', state, writer).startswith('ERR Expected numbers')
+    assert command(server, 'PLACE C 0 8 0', state, writer).startswith('ERR Sorry')
+    assert command(server, 'FIRE 0 0', state, writer) == 'ERR The game has not started yet'
+    assert command(server, 'NEW CPU 3', [None, None], writer).startswith('ERR The board size')
+    assert command(server, 'NEW CPU 10 nope', [None, None], writer).startswith('ERR Unknown ai')
+    assert command(server, 'JOIN 99', [None, None], writer) == 'ERR There is no open game 99'
+
+def test_non_ascii_lines_keep_the_game_going():
+    server = GameServer(seed=1)
+    writer = connect(server, 'NEW PVP\nPLACE é 0 0 0\nPLACE é\nRANDOM\nQUIT\n'.encode('utf-8'))
+    assert writer.lines == ['OK GAME 1 SEAT 0', 'ERR Commands have to be ASCII', 'ERR Commands have to be ASCII',
+                            'OK PLACED', 'OK BYE']
+    assert writer.closed
+
+def test_replies_echoing_the_client_are_ascii():
+    server = GameServer(seed=1)
+    writer = Writer()
+    server._send(writer, 'ERR Unknown command �')
+    assert writer.lines == ['ERR Unknown command ?']
+
+def test_long_lines_close_the_connection():
+    server = GameServer(seed=1)
+    writer = connect(server, b'NEW PVP\n' + b'x'*5000 + b'\n')
+    assert writer.lines == ['OK GAME 1 SEAT 0', 'ERR Line too long']
+    assert not server.sessions
+
+def test_game_against_the_cpu():
+    server = GameServer(seed=1)
+    cells = ''.join('FIRE {} {}\n'.format(row, col) for row in range(10) for col in range(10))
+    writer = connect(server, ('NEW CPU 10 hunt\nRANDOM\n' + cells).encode('ascii'))
+    lines = writer.lines
+    assert lines[:4] == ['OK GAME 1 SEAT 0', 'OK PLACED', 'START', 'TURN']
+    assert any(line.startswith(('WIN', 'LOSE')) for line in lines)
+    assert lines[-1] == 'ERR The game is over'
+
+def test_pvp_turns():
+    server = GameServer(seed=1)
+    first, second = Writer(), Writer()
+    state_1, state_2 = [None, None], [None, None]
+    server.command('NEW PVP', state_1, first)
+    server.command('JOIN 1', state_2, second)
+    server.command('RANDOM', state_1, first)
+    server.command('RANDOM', state_2, second)
+    assert command(server, 'FIRE 0 0', state_2, second) == 'ERR It is not your turn'
+    server.command('FIRE 0 0', state_1, first)
+    assert first.lines[-1].startswith('SHOT 0 0')
+    assert second.lines[-2].startswith('INCOMING 0 0')
+    assert second.lines[-1] == 'TURN'
+    assert command(server, 'FIRE 0 0', state_1, first) == 'ERR It is not your turn'
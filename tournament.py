@@ -0,0 +1,219 @@
+'''
+Round-robin tournament between the shooting strategies.
+
+Every pair of strategies plays a matchup of games in pairs with the same seed,
+once with each strategy as the user, so that neither gains from shooting
+first. Instead of a fixed number of games a matchup stops as soon as a
+sequential probability ratio test (SPRT) can tell which of the two is better
+by more than delta, or when max_games is reached and the matchup is a tie.
+Clear matchups are settled after a few dozen games instead of thousands.
+
+Usage:
+    python tournament.py
+    python tournament.py -s random hunt density --delta 0.03 --max-games 4000
+    python tournament.py --seed 1 --json results.json
+    python tournament.py -n 15 --fleet C=5,b=4x2,c=3x2,d=2x3
+'''
+import argparse
+import json
+import math
+import random
+import sys
+from battleship import STRATEGIES, Fleet, DEFAULT_FLEET
+from simulation import play_game, game_seed
+
+def wilson_interval(wins, games, z=1.96):
+    '''
+    Wilson score interval of a win rate.
+    '''
+    if not games:
+        return 0.0, 1.0
+    p = wins / games
+    centre = (p + z*z/(2*games)) / (1 + z*z/games)
+    half = z*math.sqrt(p*(1-p)/games + z*z/(4*games*games)) / (1 + z*z/games)
+    return max(0.0, centre-half), min(1.0, centre+half)
+
+def mean_interval(total, total_sq, count, z=1.96):
+    '''
+    Mean and normal confidence interval from the sum and the sum of squares
+    of count values.
+    '''
+    if not count:
+        return 0.0, 0.0, 0.0
+    mean = total / count
+    if count < 2:
+        return mean, mean, mean
+    var = max(0.0, (total_sq - count*mean*mean) / (count-1))
+    half = z*math.sqrt(var/count)
+    return mean, mean-half, mean+half
+
+class Matchup:
+    '''
+    Running results of strategy a against strategy b and the SPRT of the win
+    rate of a between 0.5-delta (b is better) and 0.5+delta (a is better).
+    '''
+    def __init__(self, a, b, delta=0.05, alpha=0.05, beta=0.05):
+        self.a = a
+        self.b = b
+        self.games = 0
+        self.a_wins = 0
+        # shots fired by the winner in the games each strategy won
+        self.turns = {a: [0, 0], b: [0, 0]}
+        # log likelihood ratio added by a win and a loss of a
+        self.win_step = math.log((0.5+delta) / (0.5-delta))
+        self.loss_step = -self.win_step
+        self.upper = math.log((1-beta) / alpha)
+        self.lower = math.log(beta / (1-alpha))
+        self.llr = 0.0
+        # a, b or None while undecided, 'tie' when max_games ran out
+        self.winner = None
+
+    def record(self, winner, turns):
+        self.games += 1
+        if winner == self.a:
+            self.a_wins += 1
+            self.llr += self.win_step
+        else:
+            self.llr += self.loss_step
+        self.turns[winner][0] += turns
+        self.turns[winner][1] += turns*turns
+
+    def decide(self, max_games):
+        '''
+        Check the SPRT boundaries and return True once the matchup is settled.
+        '''
+        if self.llr >= self.upper:
+            self.winner = self.a
+        elif self.llr <= self.lower:
+            self.winner = self.b
+        elif self.games >= max_games:
+            self.winner = 'tie'
+        return self.winner is not None
+
+    def win_rate(self, name, z=1.96):
+        wins = self.a_wins if name == self.a else self.games - self.a_wins
+        low, high = wilson_interval(wins, self.games, z)
+        return (wins / self.games if self.games else 0.0), low, high
+
+    def turns_to_win(self, name, z=1.96):
+        total, total_sq = self.turns[name]
+        wins = self.a_wins if name == self.a else self.games - self.a_wins
+        return mean_interval(total, total_sq, wins, z)
+
+    def summary(self):
+        return {'a': self.a,
+                'b': self.b,
+                'games': self.games,
+                'winner': self.winner,
+                'win_rate': {name: self.win_rate(name) for name in (self.a, self.b)},
+                'turns_to_win': {name: self.turns_to_win(name) for name in (self.a, self.b)}}
+
+def play_matchup(a, b, n=10, seed=None, delta=0.05, alpha=0.05, beta=0.05, max_games=10000, fleet=None):
+    '''
+    Play a against b until the SPRT settles the matchup or max_games games
+    have been played and return the Matchup. a and b have to differ as the
+    games are credited by strategy name.
+    Games are played in pairs with the same seed, a is the user in the first
+    and b in the second game of every pair.
+    '''
+    if a == b:
+        raise ValueError("A strategy can not play a matchup against itself")
+    if seed is None:
+        seed = random.getrandbits(32)
+    matchup = Matchup(a, b, delta, alpha, beta)
+    index = 0
+    while not matchup.decide(max_games):
+        for user, enemy in ((a, b), (b, a)):
+            battle = play_game(n, game_seed(seed, index), enemy_ai=enemy, user_ai=user, fleet=fleet)
+            if battle.enem_hp == 0:
+                matchup.record(user, battle.user_shots)
+            else:
+                matchup.record(enemy, battle.enem_shots)
+        index += 1
+    return matchup
+
+def tournament(strategies=None, n=10, seed=None, delta=0.05, alpha=0.05, beta=0.05, max_games=10000, log=None,
+               fleet=None):
+    '''
+    Play every pair of strategies against each other and return the matchups
+    and the standings. Every strategy scores one point for a matchup it wins
+    and half a point for a tie, ties in the standings are broken by the
+    overall win rate. Raises ValueError if a strategy is given twice.
+    '''
+    if strategies is None:
+        strategies = list(STRATEGIES)
+    if len(set(strategies)) != len(strategies):
+        raise ValueError("Every strategy can only be entered once")
+    if seed is None:
+        seed = random.getrandbits(32)
+    matchups = []
+    for i, a in enumerate(strategies):
+        for b in strategies[i+1:]:
+            # every matchup plays the same boards
+            matchup = play_matchup(a, b, n, seed, delta, alpha, beta, max_games, fleet)
+            matchups.append(matchup)
+            if log is not None:
+                log("{} vs {}: {} after {} games".format(a, b, matchup.winner, matchup.games))
+    table = {name: {'score': 0.0, 'games': 0, 'wins': 0} for name in strategies}
+    for m in matchups:
+        for name in (m.a, m.b):
+            wins = m.a_wins if name == m.a else m.games - m.a_wins
+            table[name]['games'] += m.games
+            table[name]['wins'] += wins
+            if m.winner == name:
+                table[name]['score'] += 1
+            elif m.winner == 'tie':
+                table[name]['score'] += 0.5
+    standings = []
+    for name, row in table.items():
+        rate = row['wins'] / row['games'] if row['games'] else 0.0
+        standings.append({'strategy': name, 'score': row['score'], 'games': row['games'], 'win_rate': rate})
+    standings.sort(key=lambda row: (-row['score'], -row['win_rate']))
+    return matchups, standings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--strategies', nargs='+', choices=list(STRATEGIES), help='strategies to rank')
+    parser.add_argument('-n', type=int, default=10, help='board size')
+    parser.add_argument('--fleet', help='ships of both players, e.g. C=5,b=4,c=3,s=3,d=2')
+    parser.add_argument('--seed', type=int, help='seed of the games')
+    parser.add_argument('--delta', type=float, default=0.05,
+                        help='smallest difference of the win rate from 0.5 that matters')
+    parser.add_argument('--alpha', type=float, default=0.05, help='error rate of calling a the winner')
+    parser.add_argument('--beta', type=float, default=0.05, help='error rate of calling b the winner')
+    parser.add_argument('--max-games', type=int, default=10000, help='games after which a matchup is a tie')
+    parser.add_argument('--json', help='file to write the results to as JSON')
+    args = parser.parse_args(argv)
+    if not 0 < args.delta < 0.5:
+        parser.error("delta has to be between 0 and 0.5")
+    if args.strategies and len(set(args.strategies)) != len(args.strategies):
+        parser.error("every strategy can only be given once")
+    try:
+        fleet = Fleet.parse(args.fleet) if args.fleet else DEFAULT_FLEET
+        fleet.check(args.n)
+    except ValueError as e:
+        parser.error(str(e))
+
+    matchups, standings = tournament(args.strategies, args.n, args.seed, args.delta, args.alpha, args.beta,
+                                     args.max_games, log=lambda line: print(line, file=sys.stderr), fleet=fleet)
+    for m in matchups:
+        print("{} vs {}: winner {} after {} games".format(m.a, m.b, m.winner, m.games))
+        for name in (m.a, m.b):
+            rate, low, high = m.win_rate(name)
+            line = "    {:<10} win rate {:.3f} [{:.3f}, {:.3f}]".format(name, rate, low, high)
+            if rate > 0:
+                line += "  turns to win {:.1f} [{:.1f}, {:.1f}]".format(*m.turns_to_win(name))
+            print(line)
+    played = sum(m.games for m in matchups)
+    print("{} games played, {} with a fixed max of {} per matchup".format(played, len(matchups)*args.max_games,
+                                                                        args.max_games))
+    print("Standings")
+    for i, row in enumerate(standings, 1):
+        print("{:>3}. {:<10} score {:<4} win rate {:.3f} over {} games".format(i, row['strategy'], row['score'],
+                                                                             row['win_rate'], row['games']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'matchups': [m.summary() for m in matchups], 'standings': standings}, f, indent=2)
+
+if __name__ == '__main__':
+    main()